@@ -6,6 +6,7 @@ The agent will be accessible at: agent1qdntx3ua69pewxqqvxa4gntvqf8t47flu2xv5zsj8
 from __future__ import annotations
 
 import os
+import logging
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -16,54 +17,63 @@ from analyzer_agent import (
     analyzer_agent,
     AnalyzeRequest,
     AnalysisResponse,
-    qwen_analyzer,
     initialize_qwen,
     handle_analyze_request,
     analysis_protocol
 )
 
+from log_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
 # Agentverse configuration
 AGENTVERSE_API_KEY = os.getenv("AGENTVERSE_API_KEY")
+EXPECTED_ADDRESS = "agent1qdntx3ua69pewxqqvxa4gntvqf8t47flu2xv5zsj87n6xd9vpa47kll3wgp"
 
-if not AGENTVERSE_API_KEY:
-    print("⚠️  Warning: AGENTVERSE_API_KEY not set in .env")
-    print("   The agent will run locally but won't register with Agentverse")
 
-# Print agent information
-print("=" * 60)
-print("ELARA Trade Analyzer - Agentverse Deployment")
-print("=" * 60)
-print(f"Agent Name: {analyzer_agent.name}")
-print(f"Agent Address: {analyzer_agent.address}")
-print(f"Expected Address: agent1qdntx3ua69pewxqqvxa4gntvqf8t47flu2xv5zsj87n6xd9vpa47kll3wgp")
-print(f"Port: {analyzer_agent._port}")
-print(f"Agentverse API Key: {'✓ Configured' if AGENTVERSE_API_KEY else '✗ Not set'}")
-print("=" * 60)
-
-# Verify the agent address matches
-expected_address = "agent1qdntx3ua69pewxqqvxa4gntvqf8t47flu2xv5zsj87n6xd9vpa47kll3wgp"
-if str(analyzer_agent.address) == expected_address:
-    print("✓ Agent address matches registered ELARA address")
-else:
-    print("⚠️  Agent address mismatch!")
-    print(f"   Current: {analyzer_agent.address}")
-    print(f"   Expected: {expected_address}")
-    print("   Update ANALYZER_AGENT_SEED in .env to match ELARA's seed")
+def log_deployment_info() -> None:
+    """Log agent identity and configuration before starting."""
+    if not AGENTVERSE_API_KEY:
+        logger.warning("AGENTVERSE_API_KEY not set in .env")
+        logger.warning("The agent will run locally but won't register with Agentverse")
+    
+    logger.info("=" * 60)
+    logger.info("ELARA Trade Analyzer - Agentverse Deployment")
+    logger.info("=" * 60)
+    logger.info("Agent Name: %s", analyzer_agent.name)
+    logger.info("Agent Address: %s", analyzer_agent.address)
+    logger.info("Expected Address: %s", EXPECTED_ADDRESS)
+    logger.info("Port: %s", analyzer_agent._port)
+    logger.info("Agentverse API Key: %s", "✓ Configured" if AGENTVERSE_API_KEY else "✗ Not set")
+    logger.info("=" * 60)
+    
+    # Verify the agent address matches
+    if str(analyzer_agent.address) == EXPECTED_ADDRESS:
+        logger.info("✓ Agent address matches registered ELARA address")
+    else:
+        logger.warning("Agent address mismatch!")
+        logger.warning("   Current: %s", analyzer_agent.address)
+        logger.warning("   Expected: %s", EXPECTED_ADDRESS)
+        logger.warning("   Update ANALYZER_AGENT_SEED in .env to match ELARA's seed")
+    
+    logger.info("Protocols:")
+    logger.info("  - TradeAnalysis v1.0")
+    logger.info("Message Models:")
+    logger.info("  - AnalyzeRequest (input)")
+    logger.info("  - AnalysisResponse (output)")
+    logger.info("=" * 60)
 
-print("\nProtocols:")
-print(f"  - TradeAnalysis v1.0")
-print("\nMessage Models:")
-print(f"  - AnalyzeRequest (input)")
-print(f"  - AnalysisResponse (output)")
-print("\n" + "=" * 60)
 
 # Run the agent
 if __name__ == "__main__":
-    print("\n🚀 Starting ELARA agent for Agentverse...")
-    print("   The agent will register with Almanac and Agentverse")
-    print("   Press Ctrl+C to stop\n")
+    configure_logging()
+    log_deployment_info()
+    
+    logger.info("🚀 Starting ELARA agent for Agentverse...")
+    logger.info("   The agent will register with Almanac and Agentverse")
+    logger.info("   Press Ctrl+C to stop")
     
     try:
         analyzer_agent.run()
     except KeyboardInterrupt:
-        print("\n\n✓ Agent stopped gracefully")
+        logger.info("✓ Agent stopped gracefully")
@@ -6,13 +6,19 @@ Qwen3 for detailed reasoning and confidence scoring.
 from __future__ import annotations
 
 import os
-from typing import Optional
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 from uagents import Agent, Context, Model, Protocol
-from qwen3_client import Qwen3Analyzer
+from qwen3_client import cached_prompt_tokens, get_qwen
+from cache_manager import AGENT_KEY_PREFIX, get_cache_manager
+from log_config import configure_logging
 
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Message models for analysis protocol
 class AnalyzeRequest(Model):
     """Request to analyze a trading pair."""
@@ -43,36 +49,235 @@ class AnalysisResponse(Model):
     spread_mean: float
     spread_std: float
     beta: float
+    # True for an early response carrying only signal/confidence; the full one follows
+    partial: bool = False
 
 
 # Create analyzer agent
 AGENT_SEED = os.getenv("ANALYZER_AGENT_SEED", "analyzer_agent_seed_phrase_change_me")
 AGENT_PORT = int(os.getenv("ANALYZER_AGENT_PORT", "8001"))
 AGENT_ENDPOINT = os.getenv("ANALYZER_AGENT_ENDPOINT", f"http://localhost:{AGENT_PORT}/submit")
+CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "24"))
+
+# Micro-batching: requests arriving within BATCH_INTERVAL_MS share one Qwen3 call
+MAX_BATCH = int(os.getenv("ANALYZER_MAX_BATCH", "8"))
+BATCH_INTERVAL_MS = int(os.getenv("ANALYZER_BATCH_INTERVAL_MS", "10"))
+
+# Stream Qwen3 output and send a partial response as soon as signal/confidence are known
+STREAM_PARTIAL = os.getenv("ANALYZER_STREAM_PARTIAL", "false").lower() == "true"
 
 analyzer_agent = Agent(
     name="trade_analyzer",
     seed=AGENT_SEED,
     port=AGENT_PORT,
     endpoint=AGENT_ENDPOINT,
+    # Run handlers as tasks; otherwise they are awaited one at a time, so the
+    # micro-batch queue and single-flight map never see concurrent requests
+    handle_messages_concurrently=True,
 )
 
-# Initialize Qwen3 client (stored in agent's storage for reuse)
-qwen_analyzer: Optional[Qwen3Analyzer] = None
+# Pending (metrics, future) pairs for the batch worker, created on startup
+_batch_queue: Optional[asyncio.Queue] = None
+_batch_task: Optional[asyncio.Task] = None
+# Batches currently being analyzed (kept referenced until they finish)
+_running_batches: set = set()
+
+# Metrics that shape an analysis (also the fields stored with a cached one)
+_METRIC_KEYS = ("zScore", "corr", "mean", "std", "beta", "volatility")
+
+# In-flight analyses by (symbolA, symbolB, *metrics): concurrent duplicates await the same task
+_inflight: Dict[tuple, asyncio.Task] = {}
 
 
 @analyzer_agent.on_event("startup")
 async def initialize_qwen(ctx: Context):
-    """Initialize Qwen3 model on agent startup."""
-    global qwen_analyzer
+    """Initialize Qwen3 model and the analysis cache eagerly on agent startup."""
+    global _batch_queue, _batch_task
+    get_cache_manager()
+    
     ctx.logger.info("Initializing Qwen3 analyzer with OpenRouter...")
     
     try:
-        qwen_analyzer = Qwen3Analyzer()
+        qwen_analyzer = get_qwen()
         ctx.logger.info(f"✓ Qwen3 analyzer ready (model: {qwen_analyzer.model_name})")
     except Exception as e:
         ctx.logger.error(f"✗ Failed to initialize Qwen3: {e}")
         raise RuntimeError("Qwen3 initialization failed - check OPENROUTER_API_KEY in .env")
+    
+    _batch_queue = asyncio.Queue()
+    _batch_task = asyncio.create_task(_batch_worker(ctx))
+
+
+@analyzer_agent.on_event("shutdown")
+async def close_qwen(ctx: Context):
+    """Close the async OpenRouter client on the loop that used it."""
+    await get_qwen().aclose()
+
+
+async def _batch_worker(ctx: Context):
+    """Drain queued analyses, coalescing requests that arrive close together.
+    
+    A request that is alone in the queue is analyzed immediately; otherwise the
+    worker collects up to MAX_BATCH requests within BATCH_INTERVAL_MS and sends
+    them to Qwen3 as a single batched prompt.
+    """
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        batch = [await _batch_queue.get()]
+        
+        if not _batch_queue.empty():
+            deadline = loop.time() + BATCH_INTERVAL_MS / 1000
+            while len(batch) < MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(_batch_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        
+        # Run the batch in the background so the next one can start while Qwen3 responds
+        task = asyncio.create_task(_run_batch(ctx, batch))
+        _running_batches.add(task)
+        task.add_done_callback(_running_batches.discard)
+
+
+async def _run_batch(ctx: Context, batch: list) -> None:
+    """Analyze one batch on the event loop and resolve its futures."""
+    metrics_list = [metrics for metrics, _ in batch]
+    try:
+        qwen_analyzer = get_qwen()
+        if len(batch) == 1:
+            results = [await qwen_analyzer.analyze_pair_async(metrics_list[0], 0.3)]
+        else:
+            ctx.logger.info(f"Analyzing batch of {len(batch)} pairs with one Qwen3 call")
+            results = await qwen_analyzer.analyze_pairs_batch_async(metrics_list, 0.3)
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    
+    for (_, future), analysis in zip(batch, results):
+        if not future.done():
+            future.set_result(analysis)
+
+
+async def _analyze(metrics: dict) -> dict:
+    """Queue metrics for the batch worker and wait for the analysis."""
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((metrics, future))
+    return await future
+
+
+async def _stream_analysis(metrics: dict, on_partial: Callable[[dict], Awaitable[None]]) -> dict:
+    """Stream a single-pair analysis in a worker thread, forwarding the partial result."""
+    loop = asyncio.get_running_loop()
+    
+    def consume() -> dict:
+        analysis = None
+        for analysis in get_qwen().analyze_pair_stream(metrics, 0.3):
+            if analysis.get("partial"):
+                # Wait for the send so the partial always goes out before the final response
+                asyncio.run_coroutine_threadsafe(on_partial(analysis), loop).result()
+        return analysis
+    
+    return await asyncio.to_thread(consume)
+
+
+async def _fresh_analysis(
+    ctx: Context,
+    metrics: dict,
+    on_partial: Optional[Callable[[dict], Awaitable[None]]] = None,
+) -> dict:
+    """Run a Qwen3 analysis for metrics and store it in the cache.
+    
+    With on_partial, the analysis is streamed (bypassing the batch queue) and
+    on_partial is awaited with the early signal/confidence result.
+    """
+    ctx.logger.info("Calling Qwen3 for detailed analysis...")
+    if on_partial is not None:
+        analysis = await _stream_analysis(metrics, on_partial)
+    else:
+        analysis = await _analyze(metrics)
+    
+    # Usage is per call and never cached alongside the analysis
+    usage = analysis.pop("usage", None)
+    if usage:
+        ctx.logger.info(
+            f"Qwen3 usage: prompt_tokens={usage.get('prompt_tokens')}, "
+            f"cached_prompt_tokens={cached_prompt_tokens(usage)}"
+        )
+    
+    # Unparsed-response fallbacks are returned but never cached
+    cache_manager = get_cache_manager()
+    if cache_manager and not analysis.get("fallback"):
+        try:
+            # Client-supplied metrics: kept in the agent namespace, away from /api/analyze
+            await asyncio.to_thread(
+                cache_manager.cache_analysis,
+                metrics["symbolA"],
+                metrics["symbolB"],
+                {key: metrics[key] for key in _METRIC_KEYS},
+                analysis,
+                ttl_hours=CACHE_TTL_HOURS,
+                key_prefix=AGENT_KEY_PREFIX,
+            )
+        except Exception as e:
+            ctx.logger.warning(f"Failed to cache result: {e}")
+    
+    return analysis
+
+
+async def _analyze_single_flight(
+    ctx: Context,
+    metrics: dict,
+    on_partial: Optional[Callable[[dict], Awaitable[None]]] = None,
+) -> dict:
+    """Analyze metrics, sharing one in-flight analysis between concurrent identical requests.
+    
+    Requests are identical when the pair and all metrics match; the same pair
+    with different metrics gets its own analysis. Failures propagate to every
+    waiter. The shared task is shielded so a cancelled waiter does not cancel
+    the analysis for the others. Only the request that started the analysis
+    receives partial results.
+    """
+    key = (
+        metrics["symbolA"].upper(),
+        metrics["symbolB"].upper(),
+        *(metrics[field] for field in _METRIC_KEYS),
+    )
+    task = _inflight.get(key)
+    
+    if task is None:
+        task = asyncio.create_task(_fresh_analysis(ctx, metrics, on_partial))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        ctx.logger.info(f"Joining in-flight analysis for {metrics['symbolA']}/{metrics['symbolB']}")
+    
+    return await asyncio.shield(task)
+
+
+def _build_response(msg: AnalyzeRequest, analysis: dict, partial: bool = False) -> AnalysisResponse:
+    """Build an AnalysisResponse for msg from a Qwen3 analysis dict."""
+    return AnalysisResponse(
+        symbolA=msg.symbolA,
+        symbolB=msg.symbolB,
+        signal=analysis.get("signal", "NEUTRAL"),
+        confidence=float(analysis.get("confidence", 0.5)),
+        reasoning=analysis.get("reasoning", "Analysis in progress" if partial else "No detailed reasoning available"),
+        risk_level=analysis.get("risk_level", "MEDIUM"),
+        key_factors=analysis.get("key_factors", []),
+        entry_recommendation=analysis.get("entry_recommendation", "Consult additional sources"),
+        zScore=msg.zScore,
+        correlation=msg.correlation,
+        spread_mean=msg.spread_mean,
+        spread_std=msg.spread_std,
+        beta=msg.beta,
+        partial=partial,
+    )
 
 
 # Analysis protocol
@@ -84,27 +289,10 @@ async def handle_analyze_request(ctx: Context, sender: str, msg: AnalyzeRequest)
     """Handle incoming analysis request with Qwen3 reasoning."""
     ctx.logger.info(f"Received analysis request from {sender}: {msg.symbolA}/{msg.symbolB}")
     
-    if not qwen_analyzer:
-        ctx.logger.error("Qwen3 analyzer not initialized!")
-        error_response = AnalysisResponse(
-            symbolA=msg.symbolA,
-            symbolB=msg.symbolB,
-            signal="NEUTRAL",
-            confidence=0.0,
-            reasoning="Qwen3 analyzer not initialized - check configuration",
-            risk_level="HIGH",
-            key_factors=["ERROR: Analyzer not available"],
-            entry_recommendation="Do not trade - system error",
-            zScore=msg.zScore,
-            correlation=msg.correlation,
-            spread_mean=msg.spread_mean,
-            spread_std=msg.spread_std,
-            beta=msg.beta,
-        )
-        await ctx.send(sender, error_response)
-        return
-    
     try:
+        get_qwen()
+        cache_manager = get_cache_manager()
+        
         # Prepare metrics for Qwen3
         metrics = {
             "symbolA": msg.symbolA,
@@ -117,26 +305,34 @@ async def handle_analyze_request(ctx: Context, sender: str, msg: AnalyzeRequest)
             "volatility": msg.volatility,
         }
         
-        # Get Qwen3 analysis
-        ctx.logger.info("Calling Qwen3 for detailed analysis...")
-        analysis = qwen_analyzer.analyze_pair(metrics, temperature=0.3)
+        # Reuse a cached analysis when the pair's metrics have not materially changed
+        analysis = None
+        if cache_manager:
+            try:
+                cached = await asyncio.to_thread(
+                    cache_manager.get_cached_analysis,
+                    msg.symbolA,
+                    msg.symbolB,
+                    metrics,
+                    key_prefix=AGENT_KEY_PREFIX,
+                )
+                if cached:
+                    ctx.logger.info(f"✓ Cache hit for {msg.symbolA}/{msg.symbolB}")
+                    analysis = cached["analysis"]
+            except Exception as e:
+                ctx.logger.warning(f"Cache lookup failed: {e}")
+        
+        if analysis is None:
+            on_partial = None
+            if STREAM_PARTIAL:
+                async def on_partial(partial_analysis: dict) -> None:
+                    ctx.logger.info(f"Sending partial response: signal={partial_analysis['signal']}")
+                    await ctx.send(sender, _build_response(msg, partial_analysis, partial=True))
+            
+            analysis = await _analyze_single_flight(ctx, metrics, on_partial)
         
         # Build response
-        response = AnalysisResponse(
-            symbolA=msg.symbolA,
-            symbolB=msg.symbolB,
-            signal=analysis.get("signal", "NEUTRAL"),
-            confidence=float(analysis.get("confidence", 0.5)),
-            reasoning=analysis.get("reasoning", "No detailed reasoning available"),
-            risk_level=analysis.get("risk_level", "MEDIUM"),
-            key_factors=analysis.get("key_factors", []),
-            entry_recommendation=analysis.get("entry_recommendation", "Consult additional sources"),
-            zScore=msg.zScore,
-            correlation=msg.correlation,
-            spread_mean=msg.spread_mean,
-            spread_std=msg.spread_std,
-            beta=msg.beta,
-        )
+        response = _build_response(msg, analysis)
         
         ctx.logger.info(f"Sending analysis response: signal={response.signal}, confidence={response.confidence:.2f}")
         await ctx.send(sender, response)
@@ -164,11 +360,12 @@ async def handle_analyze_request(ctx: Context, sender: str, msg: AnalyzeRequest)
 
 # Register protocol
 res = analyzer_agent.include(analysis_protocol)
-print("Registered TradeAnalysis protocol:", res)
+logger.debug("Registered TradeAnalysis protocol: %s", res)
 
 
 
 if __name__ == "__main__":
+    configure_logging()
     print(f"Starting Trade Analyzer Agent on port {AGENT_PORT}...")
     print(f"Agent address: {analyzer_agent.address}")
     analyzer_agent.run()
@@ -7,8 +7,11 @@ from __future__ import annotations
 
 import os
 import asyncio
+import traceback
 import uuid
+from functools import lru_cache
 from typing import Optional, Dict
+import requests
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from uagents import Bureau
@@ -16,8 +19,9 @@ from threading import Lock
 
 # Import analyzer agent and Qwen3 client directly
 from analyzer_agent import analyzer_agent
-from qwen3_client import Qwen3Analyzer
+from qwen3_client import Qwen3Analyzer, get_qwen
 from cache_manager import get_cache_manager
+from log_config import configure_logging
 
 
 from dotenv import load_dotenv
@@ -38,14 +42,18 @@ QUERY_TIMEOUT = int(os.getenv("QUERY_TIMEOUT", "30"))
 CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "24"))
 
 # Allowed trading pairs (base symbols without -PERP suffix)
-ALLOWED_PAIRS = [
+_ALLOWED_PAIRS_ORDERED = (
     ("SOL", "BTC"),
     ("BTC", "SOL"),
     ("ETH", "BTC"),
     ("BTC", "ETH"),
     ("SOL", "ETH"),
     ("ETH", "SOL"),
-]
+)
+ALLOWED_PAIRS = frozenset(_ALLOWED_PAIRS_ORDERED)
+# Error payload fragments, built once instead of on every rejected request
+_ALLOWED_PAIRS_LIST = [f"{a}/{b}" for a, b in _ALLOWED_PAIRS_ORDERED]
+_ALLOWED_PAIRS_STR = ", ".join(_ALLOWED_PAIRS_LIST)
 
 
 @app.route("/health", methods=["GET"])
@@ -86,6 +94,20 @@ def cleanup_cache():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/cache/summary", methods=["GET"])
+def cache_summary():
+    """List live cached analyses (signal, confidence and risk level only)."""
+    if not cache_manager:
+        return jsonify({"error": "Cache not enabled"}), 503
+    
+    try:
+        limit = int(request.args.get("limit", 100))
+        return jsonify({"entries": cache_manager.get_cached_summaries(limit=limit)})
+    except Exception as e:
+        app.logger.error(f"Cache summary failed: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/analyze", methods=["POST"])
 def analyze():
     """Analyze trading pair using Qwen3-powered analysis (synchronous).
@@ -137,11 +159,10 @@ def analyze():
         base_b = symbol_b.upper().replace("-PERP", "")
         
         if (base_a, base_b) not in ALLOWED_PAIRS:
-            allowed_pairs_str = ", ".join([f"{a}/{b}" for a, b in ALLOWED_PAIRS])
             return jsonify({
-                "error": f"Trading pair not allowed. Only these pairs are supported: {allowed_pairs_str}",
+                "error": f"Trading pair not allowed. Only these pairs are supported: {_ALLOWED_PAIRS_STR}",
                 "requested_pair": f"{base_a}/{base_b}",
-                "allowed_pairs": [f"{a}/{b}" for a, b in ALLOWED_PAIRS]
+                "allowed_pairs": _ALLOWED_PAIRS_LIST
             }), 400
         
         # Ensure -PERP suffix
@@ -206,8 +227,8 @@ def analyze():
                     "entry_recommendation": analysis_result.get("entry_recommendation", "Consult additional sources"),
                 }
                 
-                # Cache the result
-                if cache_manager:
+                # Cache the result (unparsed-response fallbacks are returned but never cached)
+                if cache_manager and not analysis_result.get("fallback"):
                     try:
                         cache_manager.cache_analysis(
                             symbol_a,
@@ -231,7 +252,6 @@ def analyze():
                 
         except Exception as e:
             app.logger.error(f"Analysis failed: {e}")
-            import traceback
             traceback.print_exc()
             return jsonify({"error": f"Analysis error: {str(e)}"}), 500
             
@@ -246,8 +266,6 @@ def _calculate_metrics_sync(symbol_a: str, symbol_b: str, limit: int) -> Optiona
     Fetches metrics from https://pair-agent-a2ol.onrender.com/api/analyze
     which provides correlation, z-score, beta, spread statistics, etc.
     """
-    import requests
-    
     pair_agent_base = os.getenv("AGENT_API_BASE", "https://pair-agent-a2ol.onrender.com")
     url = f"{pair_agent_base}/api/analyze"
     
@@ -303,25 +321,37 @@ def _calculate_metrics_sync(symbol_a: str, symbol_b: str, limit: int) -> Optiona
         return None
 
 
+_PERP = "-PERP"
+
+
+@lru_cache(maxsize=128)
 def _ensure_perp(symbol: str) -> str:
     """Ensure symbol has -PERP suffix."""
+    # Already normalized: skip the upper() allocation
+    if symbol.endswith(_PERP) and symbol.isupper():
+        return symbol
     upper = symbol.upper()
-    return upper if upper.endswith("-PERP") else f"{upper}-PERP"
+    return upper if upper.endswith(_PERP) else upper + _PERP
 
 
 def run_server(host: str = "0.0.0.0", port: int = 5000, debug: bool = False):
     """Run Flask server with analyzer agent in bureau."""
     global qwen_analyzer, cache_manager
     
+    configure_logging()
+    
     # Initialize cache manager
     print("Initializing database cache...")
     cache_manager = get_cache_manager()
     if cache_manager:
         try:
-            # Cleanup expired entries on startup
-            deleted = cache_manager.cleanup_expired()
-            if deleted > 0:
-                print(f"✓ Cleaned up {deleted} expired cache entries")
+            # Cleanup expired entries on startup (unless pg_cron does it in the database)
+            if cache_manager.cleanup_scheduled:
+                print("✓ Expired entries cleaned up by pg_cron")
+            else:
+                deleted = cache_manager.cleanup_expired()
+                if deleted > 0:
+                    print(f"✓ Cleaned up {deleted} expired cache entries")
             stats = cache_manager.get_cache_stats()
             print(f"✓ Cache ready: {stats['valid_entries']} valid entries")
         except Exception as e:
@@ -330,7 +360,7 @@ def run_server(host: str = "0.0.0.0", port: int = 5000, debug: bool = False):
     # Initialize Qwen3 analyzer
     print("\nInitializing Qwen3 analyzer with OpenRouter...")
     try:
-        qwen_analyzer = Qwen3Analyzer()
+        qwen_analyzer = get_qwen()
         print(f"✓ Qwen3 analyzer ready (model: {qwen_analyzer.model_name})")
     except Exception as e:
         print(f"✗ Failed to initialize Qwen3: {e}")
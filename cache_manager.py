@@ -5,44 +5,169 @@ Uses Neon PostgreSQL to cache analysis responses for 24 hours.
 from __future__ import annotations
 
 import os
-import json
+import logging
+import threading
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Integer
+from typing import Optional, Dict, Any, Iterable, List, Tuple
+import orjson
+from sqlalchemy import create_engine, Column, String, DateTime, Integer, Index, func, select, text
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from contextlib import contextmanager
+from functools import lru_cache
+from psycopg import Connection
+from psycopg.types.json import Jsonb, set_json_loads
+from psycopg_pool import ConnectionPool
+from cachetools import TTLCache
 
 
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
+# Per-field tolerances for reusing a cached analysis: (key, absolute, relative).
+# A field matches when |requested - cached| <= absolute + relative * max(|requested|, |cached|).
+_METRIC_TOLERANCES = (
+    ("zScore", float(os.getenv("SEMANTIC_CACHE_ZSCORE_TOLERANCE", "0.1")), 0.0),
+    ("corr", float(os.getenv("SEMANTIC_CACHE_CORR_TOLERANCE", "0.02")), 0.0),
+    ("mean", 0.0, 0.10),
+    ("std", 0.0, 0.10),
+    ("beta", 0.0, 0.05),
+    ("volatility", 0.0, 0.10),
+)
+
+# Rubric thresholds from the Qwen3 system prompt; crossing one can change the signal
+_ZSCORE_BANDS = (-3.0, -2.0, -1.0, 1.0, 2.0, 3.0)
+_CORR_BANDS = (0.5, 0.7)
+
+# pg_advisory_xact_lock key serializing schema migrations across worker processes
+_MIGRATION_LOCK_KEY = 0x656C617261  # "elara"
+
+# Key namespace for analyses of client-supplied metrics (the uAgent). These are only
+# served after a metrics check, never by the metrics-blind HTTP lookup.
+AGENT_KEY_PREFIX = "agent:"
+
+# Rows removed per DELETE statement in cleanup_expired
+CLEANUP_BATCH_SIZE = int(os.getenv("CACHE_CLEANUP_BATCH_SIZE", "10000"))
+
+# pg_cron schedule for in-database expiry cleanup (used when the extension is installed)
+CLEANUP_CRON_SCHEDULE = os.getenv("CACHE_CLEANUP_CRON", "*/5 * * * *")
+
+
+def _metrics_match(requested: Dict[str, Any], cached: Dict[str, Any]) -> bool:
+    """True when cached metrics describe the same market state as the requested ones.
+    
+    Every field must be within its tolerance, and Z-score and correlation must
+    fall in the same rubric band, so a change that could flip the signal or
+    the pair's suitability always misses.
+    """
+    for key, absolute, relative in _METRIC_TOLERANCES:
+        a = requested.get(key)
+        b = cached.get(key)
+        if a is None or b is None:
+            if a is not b:
+                return False
+            continue
+        a, b = float(a), float(b)
+        if abs(a - b) > absolute + relative * max(abs(a), abs(b)):
+            return False
+    
+    for key, bands in (("zScore", _ZSCORE_BANDS), ("corr", _CORR_BANDS)):
+        a = requested.get(key)
+        if a is not None and bisect_right(bands, float(a)) != bisect_right(bands, float(cached[key])):
+            return False
+    return True
+
+
+def _psycopg_conninfo(database_url: str) -> str:
+    """Strip any SQLAlchemy driver suffix (e.g. ``postgresql+psycopg2://``) for libpq."""
+    scheme, sep, rest = database_url.partition("://")
+    return f"{scheme.split('+', 1)[0]}{sep}{rest}"
+
+
+def _sqlalchemy_url(database_url: str) -> str:
+    """Point SQLAlchemy at the psycopg 3 driver regardless of the URL's scheme."""
+    _, sep, rest = _psycopg_conninfo(database_url).partition("://")
+    return f"postgresql+psycopg{sep}{rest}"
+
+
+# libpq settings shared by both pools: fail slow queries fast and keep idle
+# connections to Neon alive instead of pinging before every checkout
+_CONNECT_ARGS = {
+    "options": f"-c statement_timeout={int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '5000'))}",
+    "keepalives": 1,
+    "keepalives_idle": 30,
+}
+
+
+# SQL equivalent of CacheManager._make_pair_key, without the namespace prefix
+_ORIENTED_PAIR_KEY_SQL = "UPPER(symbol_a) || ':' || UPPER(symbol_b)"
+
+
+def _dumps_json(obj: Any) -> str:
+    """Serialize JSONB parameters with orjson."""
+    return orjson.dumps(obj).decode()
+
+
+def _configure_connection(conn: Connection) -> None:
+    """Decode JSONB columns with orjson on pooled psycopg connections."""
+    set_json_loads(orjson.loads, conn)
+
+
+def _build_cached_response(
+    symbol_a: str,
+    symbol_b: str,
+    metrics: Dict[str, Any],
+    analysis: Dict[str, Any],
+    created_at: datetime,
+    expires_at: datetime,
+) -> Dict[str, Any]:
+    """Build the API response dict for a cache row."""
+    return {
+        "symbolA": symbol_a,
+        "symbolB": symbol_b,
+        "metrics": metrics,
+        "analysis": analysis,
+        "cached": True,
+        "cached_at": created_at.isoformat(),
+        "expires_at": expires_at.isoformat(),
+    }
+
 
 class AnalysisCache(Base):
     """Cache table for storing analysis results."""
     __tablename__ = 'analysis_cache'
+    __table_args__ = (
+        # Covers the hot lookup (pair_key = ? AND expires_at > ?) without a heap check
+        Index('ix_cache_pair_live', 'pair_key', 'expires_at'),
+        # Range scans for expired-row cleanup
+        Index('ix_cache_expires_at', 'expires_at'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     pair_key = Column(String(100), unique=True, nullable=False, index=True)
     symbol_a = Column(String(50), nullable=False)
     symbol_b = Column(String(50), nullable=False)
-    metrics_json = Column(Text, nullable=False)
-    analysis_json = Column(Text, nullable=False)
+    metrics_json = Column(JSONB, nullable=False)
+    analysis_json = Column(JSONB, nullable=False)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=False)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to API response format."""
-        return {
-            "symbolA": self.symbol_a,
-            "symbolB": self.symbol_b,
-            "metrics": json.loads(self.metrics_json),
-            "analysis": json.loads(self.analysis_json),
-            "cached": True,
-            "cached_at": self.created_at.isoformat(),
-            "expires_at": self.expires_at.isoformat(),
-        }
+        return _build_cached_response(
+            self.symbol_a,
+            self.symbol_b,
+            self.metrics_json,
+            self.analysis_json,
+            self.created_at,
+            self.expires_at,
+        )
 
 
 class CacheManager:
@@ -56,20 +181,144 @@ class CacheManager:
         
         # Create engine
         self.engine = create_engine(
-            self.database_url,
-            pool_pre_ping=True,
-            pool_recycle=3600,
+            _sqlalchemy_url(self.database_url),
+            pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "40")),
+            pool_recycle=1800,
+            # Auto-prepare statements server-side after their first execution
+            connect_args={**_CONNECT_ARGS, "prepare_threshold": 1},
+            json_serializer=_dumps_json,
+            json_deserializer=orjson.loads,
         )
         
         # Create session factory
         self.SessionLocal = sessionmaker(bind=self.engine)
+        # Read-only sessions run in autocommit mode: no BEGIN/COMMIT round trips
+        self.ReadOnlySessionLocal = sessionmaker(
+            bind=self.engine.execution_options(isolation_level="AUTOCOMMIT")
+        )
         
-        # Create tables
-        Base.metadata.create_all(self.engine)
+        # Create and migrate tables (serialized across processes, see _migrate_schema)
+        self._migrate_schema()
+        self.cleanup_scheduled = self._schedule_cleanup_job()
+        
+        # Plain psycopg pool for the hot read path (no ORM, prepared statements)
+        self._pool = ConnectionPool(
+            _psycopg_conninfo(self.database_url),
+            min_size=1,
+            max_size=int(os.getenv("DB_READ_POOL_SIZE", "10")),
+            max_lifetime=1800,
+            # Reads are single statements, so skip transaction bookkeeping entirely
+            kwargs={**_CONNECT_ARGS, "autocommit": True},
+            configure=_configure_connection,
+            open=True,
+        )
+        
+        # In-process cache in front of Postgres: pair_key -> (expires_at, response dict)
+        self._mem: TTLCache = TTLCache(
+            maxsize=int(os.getenv("CACHE_MEMORY_SIZE", "4096")),
+            ttl=int(os.getenv("CACHE_MEMORY_TTL_SECONDS", "60")),
+        )
+        # Pre-serialized responses: pair_key -> (expires_at, JSON bytes)
+        self._mem_raw: TTLCache = TTLCache(
+            maxsize=int(os.getenv("CACHE_MEMORY_SIZE", "4096")),
+            ttl=int(os.getenv("CACHE_MEMORY_TTL_SECONDS", "60")),
+        )
+        self._mem_lock = threading.RLock()
+    
+    def _migrate_schema(self) -> None:
+        """Create the tables and upgrade an existing analysis_cache table in place.
+        
+        Every worker process runs this at startup. A transaction-scoped advisory
+        lock makes them take turns, so the DDL never races and later workers
+        find the schema already migrated.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+            # create_all skips existing tables, hence the upgrades below
+            Base.metadata.create_all(conn)
+            
+            # metrics_json / analysis_json were TEXT before being switched to JSONB
+            data_type = conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name = 'analysis_cache' AND column_name = 'analysis_json'"
+            )).scalar()
+            if data_type == "text":
+                conn.execute(text(
+                    "ALTER TABLE analysis_cache "
+                    "ALTER COLUMN metrics_json TYPE JSONB USING metrics_json::jsonb, "
+                    "ALTER COLUMN analysis_json TYPE JSONB USING analysis_json::jsonb"
+                ))
+            
+            # Pair keys were briefly shared between orientations (sorted symbols, one
+            # row per unordered pair). Give every row back the key of the orientation
+            # it was computed for; with one row per unordered pair these cannot collide.
+            oriented_key = f"CASE WHEN pair_key LIKE :agent_keys THEN :agent_prefix ELSE '' END || {_ORIENTED_PAIR_KEY_SQL}"
+            conn.execute(
+                text(f"UPDATE analysis_cache SET pair_key = {oriented_key} WHERE pair_key <> {oriented_key}"),
+                {"agent_keys": f"{AGENT_KEY_PREFIX}%", "agent_prefix": AGENT_KEY_PREFIX},
+            )
+            
+            # Large reasoning texts are TOAST-compressed; lz4 (PostgreSQL 14+) is much
+            # cheaper to decompress on every read than the default pglz.
+            if conn.dialect.server_version_info >= (14,):
+                compression = conn.execute(text(
+                    "SELECT attcompression FROM pg_attribute "
+                    "WHERE attrelid = 'analysis_cache'::regclass AND attname = 'analysis_json'"
+                )).scalar()
+                if compression != "l":
+                    # Servers built without lz4 reject this; the savepoint keeps the rest
+                    # of the migration (and the cache) working with pglz.
+                    try:
+                        with conn.begin_nested():
+                            conn.execute(text(
+                                "ALTER TABLE analysis_cache ALTER COLUMN analysis_json SET COMPRESSION lz4"
+                            ))
+                    except DBAPIError as e:
+                        logger.warning("lz4 compression unavailable, keeping pglz: %s", e)
+            
+            for index in AnalysisCache.__table__.indexes:
+                index.create(conn, checkfirst=True)
+    
+    def _schedule_cleanup_job(self) -> bool:
+        """Schedule expired-row cleanup inside Postgres via pg_cron, if available.
+        
+        Returns True when the job is scheduled, in which case the application
+        does not need to call cleanup_expired itself.
+        """
+        try:
+            with self.engine.begin() as conn:
+                installed = conn.execute(text(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_cron'"
+                )).scalar()
+                if not installed:
+                    return False
+                # Named jobs are upserted, so re-running on every startup is safe.
+                # expires_at is stored as naive UTC.
+                conn.execute(
+                    text("SELECT cron.schedule('analysis_cache_gc', :schedule, :command)"),
+                    {
+                        "schedule": CLEANUP_CRON_SCHEDULE,
+                        "command": "DELETE FROM analysis_cache WHERE expires_at <= (now() AT TIME ZONE 'utc')",
+                    },
+                )
+            return True
+        except Exception as e:
+            logger.warning("Could not schedule pg_cron cache cleanup: %s", e)
+            return False
     
     @contextmanager
-    def get_session(self) -> Session:
-        """Get database session context manager."""
+    def get_session_ro(self) -> Session:
+        """Get a read-only session context manager (never commits)."""
+        session = self.ReadOnlySessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+    
+    @contextmanager
+    def get_session_rw(self) -> Session:
+        """Get a read-write session context manager (commits on success)."""
         session = self.SessionLocal()
         try:
             yield session
@@ -80,29 +329,95 @@ class CacheManager:
         finally:
             session.close()
     
-    def _make_pair_key(self, symbol_a: str, symbol_b: str) -> str:
-        """Generate cache key for trading pair."""
-        return f"{symbol_a.upper()}:{symbol_b.upper()}"
+    def _make_pair_key(self, symbol_a: str, symbol_b: str, key_prefix: str = "") -> str:
+        """Generate cache key for trading pair.
+        
+        A/B and B/A are separate rows: a B/A analysis cannot be re-expressed for
+        A/B from the stored statistics (the reverse hedge ratio, Sharpe and
+        reasoning all depend on the price series), so the reverse is a miss.
+        """
+        return f"{key_prefix}{symbol_a.upper()}:{symbol_b.upper()}"
     
     def get_cached_analysis(
         self,
         symbol_a: str,
-        symbol_b: str
+        symbol_b: str,
+        metrics: Optional[Dict[str, Any]] = None,
+        key_prefix: str = "",
     ) -> Optional[Dict[str, Any]]:
-        """Get cached analysis if available and not expired."""
+        """Get cached analysis if available and not expired.
+        
+        When ``metrics`` is given, the cached entry is only returned if its
+        stored metrics match the requested ones within per-field tolerances
+        (see _metrics_match), so near-duplicate requests reuse the analysis
+        while a changed market state triggers a fresh one. ``key_prefix``
+        selects the key namespace (AGENT_KEY_PREFIX for agent analyses).
+        """
+        pair_key = self._make_pair_key(symbol_a, symbol_b, key_prefix)
+        result = self._get_live_entry(pair_key)
+        
+        if result is None:
+            return None
+        
+        if metrics is not None and not _metrics_match(metrics, result["metrics"]):
+            return None
+        
+        return result
+    
+    def get_cached_analysis_raw(self, symbol_a: str, symbol_b: str) -> Optional[bytes]:
+        """Get the cached analysis for a pair as JSON bytes (no metrics check).
+        
+        The serialized response is memoized per pair key, so repeated cache
+        hits skip JSON encoding entirely.
+        """
         pair_key = self._make_pair_key(symbol_a, symbol_b)
+        now = datetime.utcnow()
         
-        with self.get_session() as session:
-            # Query for non-expired cache entry
-            cache_entry = session.query(AnalysisCache).filter(
-                AnalysisCache.pair_key == pair_key,
-                AnalysisCache.expires_at > datetime.utcnow()
-            ).first()
-            
-            if cache_entry:
-                return cache_entry.to_dict()
-            
+        with self._mem_lock:
+            entry = self._mem_raw.get(pair_key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        result = self.get_cached_analysis(symbol_a, symbol_b)
+        if result is None:
+            return None
+        
+        raw = orjson.dumps(result)
+        expires_at = datetime.fromisoformat(result["expires_at"])
+        with self._mem_lock:
+            self._mem_raw[pair_key] = (expires_at, raw)
+        return raw
+    
+    def _get_live_entry(self, pair_key: str) -> Optional[Dict[str, Any]]:
+        """Return the non-expired entry for a pair key, from memory or Postgres.
+        
+        The returned dict is shared with the in-memory cache and must not be mutated.
+        """
+        now = datetime.utcnow()
+        
+        with self._mem_lock:
+            entry = self._mem.get(pair_key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > now:
+                return result
+        
+        with self._pool.connection() as conn:
+            # Query for non-expired cache entry (server-side prepared after first use)
+            row = conn.execute(
+                "SELECT symbol_a, symbol_b, metrics_json, analysis_json, created_at, expires_at "
+                "FROM analysis_cache WHERE pair_key = %s AND expires_at > %s",
+                (pair_key, now),
+                prepare=True,
+            ).fetchone()
+        
+        if row is None:
             return None
+        
+        result = _build_cached_response(*row)
+        with self._mem_lock:
+            self._mem[pair_key] = (row[5], result)
+        return result
     
     def cache_analysis(
         self,
@@ -110,53 +425,177 @@ class CacheManager:
         symbol_b: str,
         metrics: Dict[str, Any],
         analysis: Dict[str, Any],
-        ttl_hours: int = 24
+        ttl_hours: int = 24,
+        key_prefix: str = "",
     ) -> None:
-        """Cache analysis result with TTL."""
-        pair_key = self._make_pair_key(symbol_a, symbol_b)
+        """Cache analysis result with TTL.
+        
+        The metrics and analysis dicts are kept by the in-memory cache, so
+        callers must not mutate them afterwards.
+        """
+        pair_key = self._make_pair_key(symbol_a, symbol_b, key_prefix)
         now = datetime.utcnow()
         expires_at = now + timedelta(hours=ttl_hours)
         
-        with self.get_session() as session:
-            # Check if entry exists
-            existing = session.query(AnalysisCache).filter(
-                AnalysisCache.pair_key == pair_key
-            ).first()
-            
-            if existing:
-                # Update existing entry
-                existing.metrics_json = json.dumps(metrics)
-                existing.analysis_json = json.dumps(analysis)
-                existing.created_at = now
-                existing.expires_at = expires_at
-            else:
-                # Create new entry
-                cache_entry = AnalysisCache(
-                    pair_key=pair_key,
-                    symbol_a=symbol_a,
-                    symbol_b=symbol_b,
-                    metrics_json=json.dumps(metrics),
-                    analysis_json=json.dumps(analysis),
-                    created_at=now,
-                    expires_at=expires_at,
-                )
-                session.add(cache_entry)
+        # Single round trip upsert keyed on the unique pair_key
+        stmt = pg_insert(AnalysisCache).values(
+            pair_key=pair_key,
+            symbol_a=symbol_a,
+            symbol_b=symbol_b,
+            metrics_json=metrics,
+            analysis_json=analysis,
+            created_at=now,
+            expires_at=expires_at,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AnalysisCache.pair_key],
+            set_={
+                "symbol_a": stmt.excluded.symbol_a,
+                "symbol_b": stmt.excluded.symbol_b,
+                "metrics_json": stmt.excluded.metrics_json,
+                "analysis_json": stmt.excluded.analysis_json,
+                "created_at": stmt.excluded.created_at,
+                "expires_at": stmt.excluded.expires_at,
+            },
+        )
+        
+        with self.get_session_rw() as session:
+            session.execute(stmt)
+        
+        result = _build_cached_response(
+            symbol_a, symbol_b, metrics, analysis, now, expires_at
+        )
+        with self._mem_lock:
+            self._mem[pair_key] = (expires_at, result)
+            self._mem_raw.pop(pair_key, None)
+    
+    def cache_analysis_bulk(
+        self,
+        entries: Iterable[Tuple[str, str, Dict[str, Any], Dict[str, Any]]],
+        ttl_hours: int = 24
+    ) -> int:
+        """Cache many (symbol_a, symbol_b, metrics, analysis) entries at once.
+        
+        Rows are streamed into a temporary table with COPY and then upserted
+        in a single statement, so a warm-up costs a few round trips instead of
+        one per entry. Later entries win when a pair appears more than once.
+        Returns the number of pairs written.
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(hours=ttl_hours)
+        
+        # ON CONFLICT cannot touch the same row twice in one statement
+        rows = {}
+        for symbol_a, symbol_b, metrics, analysis in entries:
+            rows[self._make_pair_key(symbol_a, symbol_b)] = (symbol_a, symbol_b, metrics, analysis)
+        if not rows:
+            return 0
+        
+        with self._pool.connection() as conn, conn.transaction():
+            conn.execute(
+                "CREATE TEMP TABLE analysis_cache_load ("
+                "pair_key varchar(100), symbol_a varchar(50), symbol_b varchar(50), "
+                "metrics_json jsonb, analysis_json jsonb, created_at timestamp, expires_at timestamp"
+                ") ON COMMIT DROP"
+            )
+            with conn.cursor().copy(
+                "COPY analysis_cache_load (pair_key, symbol_a, symbol_b, metrics_json, "
+                "analysis_json, created_at, expires_at) FROM STDIN"
+            ) as copy:
+                for pair_key, (symbol_a, symbol_b, metrics, analysis) in rows.items():
+                    copy.write_row((
+                        pair_key, symbol_a, symbol_b,
+                        Jsonb(metrics, dumps=_dumps_json), Jsonb(analysis, dumps=_dumps_json),
+                        now, expires_at,
+                    ))
+            conn.execute(
+                "INSERT INTO analysis_cache (pair_key, symbol_a, symbol_b, metrics_json, "
+                "analysis_json, created_at, expires_at) "
+                "SELECT pair_key, symbol_a, symbol_b, metrics_json, analysis_json, created_at, expires_at "
+                "FROM analysis_cache_load "
+                "ON CONFLICT (pair_key) DO UPDATE SET "
+                "symbol_a = EXCLUDED.symbol_a, symbol_b = EXCLUDED.symbol_b, "
+                "metrics_json = EXCLUDED.metrics_json, analysis_json = EXCLUDED.analysis_json, "
+                "created_at = EXCLUDED.created_at, expires_at = EXCLUDED.expires_at"
+            )
+        
+        with self._mem_lock:
+            for pair_key in rows:
+                self._mem.pop(pair_key, None)
+                self._mem_raw.pop(pair_key, None)
+        
+        return len(rows)
+    
+    def close(self) -> None:
+        """Close the read pool and dispose of the SQLAlchemy engine."""
+        self._pool.close()
+        self.engine.dispose()
+    
+    def get_cached_summaries(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """List live cache entries with only the headline fields (no reasoning text).
+        
+        The fields are extracted server-side from the JSONB column, so the full
+        analysis is never sent over the wire. Agent-namespace entries are not
+        listed, matching what /api/analyze serves.
+        """
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT symbol_a, symbol_b, analysis_json->'signal', analysis_json->'confidence', "
+                "analysis_json->'risk_level', created_at, expires_at "
+                "FROM analysis_cache WHERE expires_at > %s AND pair_key NOT LIKE %s "
+                "ORDER BY created_at DESC LIMIT %s",
+                (datetime.utcnow(), f"{AGENT_KEY_PREFIX}%", limit),
+                prepare=True,
+            ).fetchall()
+        
+        return [
+            {
+                "symbolA": symbol_a,
+                "symbolB": symbol_b,
+                "signal": signal,
+                "confidence": confidence,
+                "risk_level": risk_level,
+                "cached_at": created_at.isoformat(),
+                "expires_at": expires_at.isoformat(),
+            }
+            for symbol_a, symbol_b, signal, confidence, risk_level, created_at, expires_at in rows
+        ]
     
     def cleanup_expired(self) -> int:
-        """Remove expired cache entries. Returns number of deleted entries."""
-        with self.get_session() as session:
-            deleted = session.query(AnalysisCache).filter(
-                AnalysisCache.expires_at <= datetime.utcnow()
-            ).delete()
-            return deleted
+        """Remove expired cache entries. Returns number of deleted entries.
+        
+        Rows are deleted in batches of CLEANUP_BATCH_SIZE, each in its own
+        transaction, so a large backlog never holds locks for long.
+        """
+        with self._mem_lock:
+            self._mem.clear()
+            self._mem_raw.clear()
+        
+        now = datetime.utcnow()
+        deleted = 0
+        while True:
+            with self.engine.begin() as conn:
+                count = conn.execute(
+                    text(
+                        "DELETE FROM analysis_cache WHERE ctid IN ("
+                        "SELECT ctid FROM analysis_cache WHERE expires_at <= :now LIMIT :batch)"
+                    ),
+                    {"now": now, "batch": CLEANUP_BATCH_SIZE},
+                ).rowcount
+            deleted += count
+            if count < CLEANUP_BATCH_SIZE:
+                return deleted
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics."""
-        with self.get_session() as session:
-            total = session.query(AnalysisCache).count()
-            valid = session.query(AnalysisCache).filter(
-                AnalysisCache.expires_at > datetime.utcnow()
-            ).count()
+        # One Core query for both counts instead of two ORM count() round trips
+        stmt = select(
+            func.count(),
+            func.count().filter(AnalysisCache.expires_at > datetime.utcnow()),
+        ).select_from(AnalysisCache)
+        
+        with self.get_session_ro() as session:
+            total, valid = session.execute(stmt).one()
             expired = total - valid
             
             return {
@@ -166,27 +605,51 @@ class CacheManager:
             }
 
 
-# Singleton instance
-_cache_manager: Optional[CacheManager] = None
+@lru_cache(maxsize=1)
+def _build_cache_manager() -> Optional[CacheManager]:
+    """Create the cache manager singleton; raises if the database is unreachable."""
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        logger.warning("DATABASE_URL not set - caching disabled")
+        return None
+    cache_manager = CacheManager(database_url)
+    logger.info("Database cache initialized")
+    return cache_manager
 
 
 def get_cache_manager() -> Optional[CacheManager]:
-    """Get or create cache manager singleton."""
-    global _cache_manager
+    """Get or create the cache manager singleton (None when caching is disabled).
     
-    if _cache_manager is None:
-        try:
-            database_url = os.getenv("DATABASE_URL")
-            if database_url:
-                _cache_manager = CacheManager(database_url)
-                print("✓ Database cache initialized")
-            else:
-                print("⚠️  DATABASE_URL not set - caching disabled")
-        except Exception as e:
-            print(f"✗ Failed to initialize cache: {e}")
-            _cache_manager = None
+    Only a successful initialization is memoized: lru_cache does not store
+    exceptions, so after a transient failure the next call retries.
+    """
+    try:
+        return _build_cache_manager()
+    except Exception as e:
+        logger.error("Failed to initialize cache: %s", e)
+        return None
+
+
+def warmup_cache_from_dump(path: str, ttl_hours: int = 24) -> int:
+    """Bulk-load a JSON Lines dump of analyses into the cache.
+    
+    Each line is an object with symbolA, symbolB, metrics and analysis keys
+    (the shape returned by get_cached_analysis). Returns the number of pairs
+    loaded, or 0 when caching is disabled.
+    """
+    cache_manager = get_cache_manager()
+    if cache_manager is None:
+        return 0
+    
+    with open(path, "rb") as dump:
+        entries = [orjson.loads(line) for line in dump if line.strip()]
     
-    return _cache_manager
+    count = cache_manager.cache_analysis_bulk(
+        [(e["symbolA"], e["symbolB"], e["metrics"], e["analysis"]) for e in entries],
+        ttl_hours=ttl_hours,
+    )
+    logger.info("Warmed cache with %d entries from %s", count, path)
+    return count
 
 
 if __name__ == "__main__":
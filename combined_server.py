@@ -9,18 +9,33 @@ Both services run in the same process using threading.
 from __future__ import annotations
 
 import os
+import gzip
+import logging
+import math
 import time
 import threading
-from typing import Optional, Dict
+import traceback
+from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Optional, Dict, List, Tuple, Union
 
-from flask import Flask, request, jsonify
+import requests
+from asgiref.wsgi import WsgiToAsgi
+import msgspec
+import orjson
+from flask import Flask, request
+from flask_compress import Compress
 from flask_cors import CORS
+from requests.adapters import HTTPAdapter
 from uagents import Bureau
+from urllib3.util.retry import Retry
 
 # Import analyzer agent and Qwen3 client
 from analyzer_agent import analyzer_agent
-from qwen3_client import Qwen3Analyzer
+from qwen3_client import Qwen3Analyzer, get_qwen
 from cache_manager import get_cache_manager
+from log_config import configure_logging
 
 # Load environment variables
 # dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
@@ -31,8 +46,9 @@ from cache_manager import get_cache_manager
 from dotenv import load_dotenv
 load_dotenv()
 
-print("[DEBUG] OPENROUTER_API_KEY length:", len(os.getenv("OPENROUTER_API_KEY") or "MISSING"))
-print("[DEBUG] Running in:", os.getcwd())
+logger = logging.getLogger(__name__)
+logger.debug("OPENROUTER_API_KEY length: %d", len(os.getenv("OPENROUTER_API_KEY") or "MISSING"))
+logger.debug("Running in: %s", os.getcwd())
 
 # Configuration
 AGENT_PORT = int(os.getenv("ANALYZER_AGENT_PORT", "8001"))
@@ -40,29 +56,219 @@ API_PORT = int(os.getenv("PORT", os.getenv("FLASK_PORT", "10000")))
 API_HOST = os.getenv("FLASK_HOST", "0.0.0.0")
 DEBUG = os.getenv("FLASK_DEBUG", "false").lower() == "true"
 CACHE_TTL_HOURS = int(os.getenv("CACHE_TTL_HOURS", "24"))
+# In-process responses younger than this are served without touching the database
+HOT_CACHE_FRESH_SECONDS = float(os.getenv("HOT_CACHE_FRESH_SECONDS", "30"))
+# Most pairs accepted by one /api/analyze/batch request
+MAX_BATCH_PAIRS = int(os.getenv("MAX_BATCH_PAIRS", "6"))
+# How long a /health payload is reused
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "5"))
+# How long a request waits for its Qwen3 call before giving up with 504
+QWEN_TIMEOUT_SECONDS = float(os.getenv("QWEN_TIMEOUT_SECONDS", "45"))
+# How long a duplicate request waits for the in-flight analysis of its pair
+INFLIGHT_TIMEOUT_SECONDS = float(os.getenv("INFLIGHT_TIMEOUT_SECONDS", "60"))
+# "uvicorn" serves the app through asgi_app instead of Flask's development server
+API_SERVER = os.getenv("API_SERVER", "flask").lower()
+
+# Shared keep-alive session for pair-agent calls (avoids a TCP+TLS handshake per request)
+_SESSION = requests.Session()
+# "br" is decoded transparently by urllib3 when the brotli package is installed
+_SESSION.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, br"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    # The pair-agent analyze POST is a pure computation, so it is safe to retry
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+    ),
+))
 
 # Flask app
 app = Flask(__name__)
 CORS(app)
 
+# gzip/brotli for JSON responses; precompressed cache hits are left untouched
+app.config.update(
+    COMPRESS_MIMETYPES=["application/json"],
+    COMPRESS_LEVEL=4,
+    COMPRESS_MIN_SIZE=500,
+)
+Compress(app)
+
+
+def ojsonify(obj, status: int = 200, headers: Optional[Dict[str, str]] = None):
+    """jsonify replacement that encodes with orjson (bytes are sent as already-encoded JSON)."""
+    body = obj if isinstance(obj, bytes) else orjson.dumps(obj)
+    return app.response_class(body, status=status, headers=headers, mimetype="application/json")
+
+
+# ASGI entry point: lets an event-loop server (uvicorn) front the Flask app
+asgi_app = WsgiToAsgi(app)
+
+
+class AnalyzeReq(msgspec.Struct):
+    """Body of POST /api/analyze."""
+    symbolA: str
+    symbolB: str
+    limit: int = 200
+
+
+class AnalyzeBatchReq(msgspec.Struct):
+    """Body of POST /api/analyze/batch."""
+    pairs: List[AnalyzeReq]
+
+
 # Global instances
 qwen_analyzer: Optional[Qwen3Analyzer] = None
 cache_manager = None
 
-# Allowed trading pairs
-ALLOWED_PAIRS = [
+# [computed_at, payload] of the last /health response
+_HEALTH_CACHE: list = [0.0, None]
+
+# Last good /api/analyze payload per pair, pre-serialized: (symbolA, symbolB) -> (stored_at, JSON bytes).
+# Fresh entries short-circuit the request; older ones are a fallback when upstream fails.
+_HOT_CACHE: Dict[Tuple[str, str], Tuple[float, bytes]] = {}
+_HOT_CACHE_LOCK = threading.RLock()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+    __slots__ = ("tokens", "ts", "rate", "capacity", "lock")
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> float:
+        """Take one token. Returns 0 on success, else the seconds until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class CircuitBreaker:
+    """Opens for `cooldown` seconds after `threshold` consecutive failures within `window` seconds."""
+    __slots__ = ("threshold", "window", "cooldown", "failures", "first_failure", "opened_at", "lock")
+    
+    def __init__(self, threshold: int, window: float, cooldown: float):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.failures = 0
+        self.first_failure = 0.0
+        self.opened_at: Optional[float] = None
+        self.lock = threading.Lock()
+    
+    def retry_after(self) -> float:
+        """Seconds until the circuit closes again (0 when closed)."""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining <= 0:
+                # Half-open: let requests through; the next failure reopens immediately
+                self.opened_at = None
+                self.failures = self.threshold - 1
+                self.first_failure = time.monotonic()
+                return 0.0
+            return remaining
+    
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+    
+    def record_failure(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if self.failures == 0 or now - self.first_failure > self.window:
+                self.failures = 0
+                self.first_failure = now
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = now
+
+
+# Admission control for upstream (pair-agent + OpenRouter) analyses
+_UPSTREAM_BUCKET = TokenBucket(
+    rate=float(os.getenv("ANALYZE_RATE_PER_SEC", "5")),
+    capacity=float(os.getenv("ANALYZE_BURST", "10")),
+)
+_UPSTREAM_BREAKER = CircuitBreaker(
+    threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+    window=float(os.getenv("BREAKER_WINDOW_SECONDS", "60")),
+    cooldown=float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30")),
+)
+
+# Qwen3 calls run here, capping OpenRouter fan-out independently of request concurrency
+_QWEN_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("QWEN_CONCURRENCY", "16")),
+    thread_name_prefix="qwen",
+)
+
+# Pair-agent metric fetches for batch requests run here concurrently
+_FETCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="metrics")
+
+# Metrics returned by /api/analyze (and sent to Qwen3, which ignores the extras it has no use for)
+_METRIC_KEYS = (
+    "zScore",
+    "corr",
+    "mean",
+    "std",
+    "beta",
+    "volatility",
+    "currentSpread",
+    "halfLife",
+    "cointegrationPValue",
+    "isCointegrated",
+    "sharpe",
+    "signalType",
+    "dataPoints",
+)
+
+# Upstream analyses in progress per pair, shared by concurrent duplicate requests
+_INFLIGHT: Dict[Tuple[str, str], Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+# Allowed trading pairs (frozenset: O(1) membership checks per request)
+_ALLOWED_PAIRS_ORDERED = (
     ("SOL", "BTC"),
     ("BTC", "SOL"),
     ("ETH", "BTC"),
     ("BTC", "ETH"),
     ("SOL", "ETH"),
     ("ETH", "SOL"),
-]
+)
+ALLOWED_PAIRS = frozenset(_ALLOWED_PAIRS_ORDERED)
+# Error payload fragments, built once instead of on every rejected request
+_ALLOWED_PAIRS_LIST = [f"{a}/{b}" for a, b in _ALLOWED_PAIRS_ORDERED]
+_ALLOWED_PAIRS_STR = ", ".join(_ALLOWED_PAIRS_LIST)
+
+# The address is derived from the seed; stringify it once rather than per /health poll
+_AGENT_ADDR = str(analyzer_agent.address)
 
 
 @app.route("/health", methods=["GET"])
 def health():
-    """Health check endpoint."""
+    """Health check endpoint.
+    
+    The payload is reused for HEALTH_CACHE_SECONDS so frequent liveness probes
+    do not count cache rows on every hit.
+    """
+    cached_at, payload = _HEALTH_CACHE
+    if payload is not None and time.monotonic() - cached_at < HEALTH_CACHE_SECONDS:
+        return ojsonify(payload)
+    
     cache_stats = None
     if cache_manager:
         try:
@@ -70,35 +276,51 @@ def health():
         except Exception:
             pass
     
-    return jsonify({
+    payload = {
         "status": "ok",
         "service": "elara-combined",
         "agent_running": True,
-        "agent_address": str(analyzer_agent.address),
+        "agent_address": _AGENT_ADDR,
         "agent_port": AGENT_PORT,
         "api_port": API_PORT,
         "qwen_available": qwen_analyzer is not None,
         "cache_enabled": cache_manager is not None,
         "cache_stats": cache_stats,
-    })
+    }
+    _HEALTH_CACHE[:] = [time.monotonic(), payload]
+    return ojsonify(payload)
 
 
 @app.route("/cache/cleanup", methods=["POST"])
 def cleanup_cache():
     """Manually cleanup expired cache entries."""
     if not cache_manager:
-        return jsonify({"error": "Cache not enabled"}), 503
+        return ojsonify({"error": "Cache not enabled"}, 503)
     
     try:
         deleted = cache_manager.cleanup_expired()
         stats = cache_manager.get_cache_stats()
-        return jsonify({
+        return ojsonify({
             "deleted": deleted,
             "remaining": stats
         })
     except Exception as e:
-        app.logger.error(f"Cache cleanup failed: {e}")
-        return jsonify({"error": str(e)}), 500
+        app.logger.error("Cache cleanup failed: %s", e)
+        return ojsonify({"error": str(e)}, 500)
+
+
+@app.route("/cache/summary", methods=["GET"])
+def cache_summary():
+    """List live cached analyses (signal, confidence and risk level only)."""
+    if not cache_manager:
+        return ojsonify({"error": "Cache not enabled"}, 503)
+    
+    try:
+        limit = int(request.args.get("limit", 100))
+        return ojsonify({"entries": cache_manager.get_cached_summaries(limit=limit)})
+    except Exception as e:
+        app.logger.error("Cache summary failed: %s", e)
+        return ojsonify({"error": str(e)}, 500)
 
 
 @app.route("/api/analyze", methods=["POST"])
@@ -113,150 +335,371 @@ def analyze():
     }
     """
     try:
-        data = request.get_json()
+        raw_body = request.get_data()
         
-        if not data:
-            return jsonify({"error": "Request body required"}), 400
+        if not raw_body:
+            return ojsonify({"error": "Request body required"}, 400)
         
-        symbol_a = data.get("symbolA")
-        symbol_b = data.get("symbolB")
-        limit = data.get("limit", 200)
+        # Parse and validate the body in a single pass
+        try:
+            req = msgspec.json.decode(raw_body, type=AnalyzeReq)
+        except msgspec.DecodeError as e:
+            return ojsonify({"error": f"Invalid request body: {e}"}, 400)
+        
+        symbol_a = req.symbolA
+        symbol_b = req.symbolB
+        limit = req.limit
         
         if not symbol_a or not symbol_b:
-            return jsonify({"error": "symbolA and symbolB required"}), 400
+            return ojsonify({"error": "symbolA and symbolB required"}, 400)
         
         # Validate pair is allowed
         base_a = symbol_a.upper().replace("-PERP", "")
         base_b = symbol_b.upper().replace("-PERP", "")
         
         if (base_a, base_b) not in ALLOWED_PAIRS:
-            allowed_pairs_str = ", ".join([f"{a}/{b}" for a, b in ALLOWED_PAIRS])
-            return jsonify({
-                "error": f"Trading pair not allowed. Only these pairs are supported: {allowed_pairs_str}",
+            return ojsonify({
+                "error": f"Trading pair not allowed. Only these pairs are supported: {_ALLOWED_PAIRS_STR}",
                 "requested_pair": f"{base_a}/{base_b}",
-                "allowed_pairs": [f"{a}/{b}" for a, b in ALLOWED_PAIRS]
-            }), 400
+                "allowed_pairs": _ALLOWED_PAIRS_LIST
+            }, 400)
         
         # Ensure -PERP suffix
         symbol_a = _ensure_perp(symbol_a)
         symbol_b = _ensure_perp(symbol_b)
         
+        pair = (symbol_a, symbol_b)
+        
         # Check cache first
-        if cache_manager:
+        cached_raw = _lookup_cached_raw(pair)
+        if cached_raw:
+            return _cached_response(cached_raw)
+        
+        # Only one request per pair runs the upstream analysis; concurrent duplicates wait for it
+        with _INFLIGHT_LOCK:
+            future = _INFLIGHT.get(pair)
+            owner = future is None
+            if owner:
+                future = Future()
+                _INFLIGHT[pair] = future
+        
+        if owner:
             try:
-                cached_result = cache_manager.get_cached_analysis(symbol_a, symbol_b)
-                if cached_result:
-                    app.logger.info(f"✓ Cache hit for {symbol_a}/{symbol_b}")
-                    return jsonify(cached_result)
+                body, status, headers = _guarded_analysis(symbol_a, symbol_b, limit)
+                future.set_result((body, status, headers))
             except Exception as e:
-                app.logger.warning(f"Cache lookup failed: {e}")
+                future.set_exception(e)
+                raise
+            finally:
+                with _INFLIGHT_LOCK:
+                    _INFLIGHT.pop(pair, None)
+        else:
+            app.logger.info("Joining in-flight analysis for %s/%s", symbol_a, symbol_b)
+            try:
+                body, status, headers = future.result(timeout=INFLIGHT_TIMEOUT_SECONDS)
+            except FutureTimeoutError:
+                app.logger.error(
+                    "In-flight analysis for %s/%s still running after %.0fs",
+                    symbol_a, symbol_b, INFLIGHT_TIMEOUT_SECONDS,
+                )
+                stale = _stale_response(pair)
+                if stale:
+                    return ojsonify(*stale)
+                return ojsonify({"error": "Timed out waiting for the in-flight analysis of this pair"}, 504)
         
-        # Calculate metrics
-        metrics = _calculate_metrics_sync(symbol_a, symbol_b, limit)
-        print(metrics)
+        return ojsonify(body, status, headers)
+            
+    except Exception as e:
+        app.logger.error("Endpoint error: %s", e)
+        return ojsonify({"error": str(e)}, 500)
+
+
+@app.route("/api/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """Analyze several trading pairs, sharing one Qwen3 call between the uncached ones.
+    
+    Request body:
+    {
+        "pairs": [{"symbolA": "BTC-PERP", "symbolB": "ETH-PERP", "limit": 200}, ...]
+    }
+    
+    Returns {"results": [...]} in request order. Each entry has the
+    /api/analyze response shape, or symbolA/symbolB/error for a pair that
+    could not be analyzed.
+    """
+    try:
+        raw_body = request.get_data()
         
-        if not metrics:
-            return jsonify({"error": "Failed to calculate metrics"}), 500
+        if not raw_body:
+            return ojsonify({"error": "Request body required"}, 400)
         
-        # Call Qwen3 analyzer
-        app.logger.info(f"Analyzing {symbol_a}/{symbol_b} with Qwen3")
+        try:
+            req = msgspec.json.decode(raw_body, type=AnalyzeBatchReq)
+        except msgspec.DecodeError as e:
+            return ojsonify({"error": f"Invalid request body: {e}"}, 400)
         
-        if not qwen_analyzer:
-            return jsonify({"error": "Qwen3 analyzer not initialized"}), 503
+        if not req.pairs or len(req.pairs) > MAX_BATCH_PAIRS:
+            return ojsonify({"error": f"pairs must contain between 1 and {MAX_BATCH_PAIRS} entries"}, 400)
         
-        try:
-            analysis_metrics = {
-                "symbolA": symbol_a,
-                "symbolB": symbol_b,
-                "zScore": metrics["zScore"],
-                "corr": metrics["corr"],
-                "mean": metrics["mean"],
-                "std": metrics["std"],
-                "beta": metrics["beta"],
-                "volatility": metrics["volatility"],
-                # extended optional metrics for richer prompt
-                "currentSpread": metrics.get("currentSpread"),
-                "halfLife": metrics.get("halfLife"),
-                "sharpe": metrics.get("sharpe"),
-                "signalType": metrics.get("signalType"),
-            }
-            
-            analysis_result = qwen_analyzer.analyze_pair(analysis_metrics, temperature=0.3)
-            
-            metrics_data = {
-                "zScore": metrics["zScore"],
-                "corr": metrics["corr"],
-                "mean": metrics["mean"],
-                "std": metrics["std"],
-                "beta": metrics["beta"],
-                "volatility": metrics["volatility"],
-                # passthrough extended fields when present
-                "currentSpread": metrics.get("currentSpread"),
-                "halfLife": metrics.get("halfLife"),
-                "cointegrationPValue": metrics.get("cointegrationPValue"),
-                "isCointegrated": metrics.get("isCointegrated"),
-                "sharpe": metrics.get("sharpe"),
-                "signalType": metrics.get("signalType"),
-                "dataPoints": metrics.get("dataPoints"),
-            }
-            
-            analysis_data = {
-                "signal": analysis_result.get("signal", "NEUTRAL"),
-                "confidence": float(analysis_result.get("confidence", 0.5)),
-                "reasoning": analysis_result.get("reasoning", "No reasoning available"),
-                "risk_level": analysis_result.get("risk_level", "MEDIUM"),
-                "key_factors": analysis_result.get("key_factors", []),
-                "entry_recommendation": analysis_result.get("entry_recommendation", "Consult additional sources"),
-            }
+        # Each result is encoded JSON, so cache hits are spliced in without re-encoding
+        results: List[Optional[bytes]] = [None] * len(req.pairs)
+        misses = []
+        for i, item in enumerate(req.pairs):
+            base_a = item.symbolA.upper().replace("-PERP", "")
+            base_b = item.symbolB.upper().replace("-PERP", "")
+            if (base_a, base_b) not in ALLOWED_PAIRS:
+                results[i] = orjson.dumps(
+                    {"symbolA": item.symbolA, "symbolB": item.symbolB, "error": "Trading pair not allowed"}
+                )
+                continue
             
-            # Cache the result
-            if cache_manager:
-                try:
-                    cache_manager.cache_analysis(
-                        symbol_a,
-                        symbol_b,
-                        metrics_data,
-                        analysis_data,
-                        ttl_hours=CACHE_TTL_HOURS
-                    )
-                    app.logger.info(f"✓ Cached result for {symbol_a}/{symbol_b}")
-                except Exception as e:
-                    app.logger.warning(f"Failed to cache: {e}")
+            pair = (_ensure_perp(item.symbolA), _ensure_perp(item.symbolB))
+            cached_raw = _lookup_cached_raw(pair)
+            if cached_raw:
+                results[i] = cached_raw
+            else:
+                misses.append((i, pair, item.limit))
+        
+        if misses:
+            if not qwen_analyzer:
+                error = "Qwen3 analyzer not initialized"
+            elif _UPSTREAM_BREAKER.retry_after():
+                error = "Upstream cooling down"
+            elif _UPSTREAM_BUCKET.acquire():
+                error = "Rate limit exceeded"
+            else:
+                error = None
             
-            return jsonify({
-                "symbolA": symbol_a,
-                "symbolB": symbol_b,
-                "metrics": metrics_data,
-                "analysis": analysis_data,
-                "cached": False,
-            })
-                
-        except RuntimeError as e:
-            # Likely an upstream API failure (OpenRouter) or authentication issue
-            app.logger.error(f"Analysis failed: {e}")
-            import traceback
-            traceback.print_exc()
-            # Return a clear 502/503 with guidance for missing/invalid API key
-            guidance = (
-                "OpenRouter request failed. Check OPENROUTER_API_KEY and account access. "
-                "If running on Render, add OPENROUTER_API_KEY as a secret in service settings."
-            )
-            return jsonify({"error": "Upstream analysis error", "details": str(e), "guidance": guidance}), 502
+            if error:
+                for i, pair, _ in misses:
+                    results[i] = _batch_error(pair, error)
+            else:
+                _analyze_batch_uncached(misses, results)
+        
+        return ojsonify(b'{"results":[' + b",".join(results) + b"]}")
+        
+    except Exception as e:
+        app.logger.error("Endpoint error: %s", e)
+        return ojsonify({"error": str(e)}, 500)
+
+
+def _lookup_cached_raw(pair: Tuple[str, str]) -> Optional[bytes]:
+    """Return the cached payload for a pair as JSON bytes: a fresh hot-cache entry, else the database cache."""
+    hot = _hot_cache_get(pair)
+    if hot and time.monotonic() - hot[0] < HOT_CACHE_FRESH_SECONDS:
+        return hot[1]
+    
+    if cache_manager:
+        try:
+            cached_raw = cache_manager.get_cached_analysis_raw(*pair)
+            if cached_raw:
+                app.logger.info("✓ Cache hit for %s/%s", pair[0], pair[1])
+                _hot_cache_put(pair, cached_raw)
+                return cached_raw
         except Exception as e:
-            app.logger.error(f"Analysis failed: {e}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({"error": f"Analysis error: {str(e)}"}), 500
+            app.logger.warning("Cache lookup failed: %s", e)
+    return None
+
+
+def _cached_response(raw: bytes):
+    """Response for an encoded cache hit, gzipped once and reused when the client accepts it."""
+    if len(raw) >= app.config["COMPRESS_MIN_SIZE"] and "gzip" in request.accept_encodings:
+        response = ojsonify(_gzip_payload(raw))
+        response.headers["Content-Encoding"] = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+    return ojsonify(raw)
+
+
+@lru_cache(maxsize=64)
+def _gzip_payload(raw: bytes) -> bytes:
+    """Gzip an encoded payload; hot-cache hits return the same bytes object, so this is computed once."""
+    return gzip.compress(raw, compresslevel=app.config["COMPRESS_LEVEL"])
+
+
+def _batch_error(pair: Tuple[str, str], error: str) -> bytes:
+    """Encoded result for a batch pair that could not be analyzed (stale payload when available)."""
+    stale = _stale_response(pair)
+    if stale:
+        return orjson.dumps(stale[0])
+    return orjson.dumps({"symbolA": pair[0], "symbolB": pair[1], "error": error})
+
+
+def _analyze_batch_uncached(misses: list, results: List[Optional[bytes]]) -> None:
+    """Fetch metrics for (index, pair, limit) misses concurrently, then analyze them in one Qwen3 call."""
+    fetched = list(_FETCH_POOL.map(lambda miss: _calculate_metrics_sync(*miss[1], miss[2]), misses))
+    
+    ready = []
+    for (i, pair, _), metrics in zip(misses, fetched):
+        if metrics:
+            ready.append((i, pair, {key: metrics.get(key) for key in _METRIC_KEYS}))
+        else:
+            results[i] = _batch_error(pair, "Failed to calculate metrics")
+    if not ready:
+        return
+    
+    app.logger.info("Analyzing %d pairs with one Qwen3 call", len(ready))
+    try:
+        # The batched response grows with the number of pairs, and so does the timeout.
+        # The worker gets the same deadline, so it stops once this request gives up.
+        timeout = QWEN_TIMEOUT_SECONDS * len(ready)
+        analyses = _QWEN_POOL.submit(
+            qwen_analyzer.analyze_pairs_batch,
+            [{**metrics_out, "symbolA": pair[0], "symbolB": pair[1]} for _, pair, metrics_out in ready],
+            temperature=0.3,
+            deadline=time.monotonic() + timeout,
+        ).result(timeout=timeout)
+        _UPSTREAM_BREAKER.record_success()
+    except (FutureTimeoutError, RuntimeError) as e:
+        app.logger.error("Batch analysis failed: %r", e)
+        _UPSTREAM_BREAKER.record_failure()
+        for i, pair, _ in ready:
+            results[i] = _batch_error(pair, "Upstream analysis error")
+        return
+    
+    for (i, pair, metrics_out), analysis_result in zip(ready, analyses):
+        results[i] = _store_result(pair[0], pair[1], metrics_out, analysis_result)
+
+
+def _guarded_analysis(symbol_a: str, symbol_b: str, limit: int) -> Tuple[Union[dict, bytes], int, Dict[str, str]]:
+    """Run _analyze_uncached unless the circuit is open or the rate limit is exhausted.
+    
+    Returns (response body, status code, extra headers). Rejections answer
+    immediately with Retry-After instead of tying up a worker on a doomed
+    upstream call.
+    """
+    retry_after = _UPSTREAM_BREAKER.retry_after()
+    if retry_after:
+        stale = _stale_response((symbol_a, symbol_b))
+        if stale:
+            return (*stale, {})
+        return {"error": "Upstream cooling down"}, 503, {"Retry-After": str(math.ceil(retry_after))}
+    
+    wait = _UPSTREAM_BUCKET.acquire()
+    if wait:
+        return {"error": "Rate limit exceeded"}, 429, {"Retry-After": str(math.ceil(wait))}
+    
+    body, status = _analyze_uncached(symbol_a, symbol_b, limit)
+    return body, status, {}
+
+
+def _analyze_uncached(symbol_a: str, symbol_b: str, limit: int) -> Tuple[Union[dict, bytes], int]:
+    """Fetch metrics, run Qwen3 and cache the result.
+    
+    Returns (response body, status code); the body is already-encoded JSON
+    for a successful analysis.
+    """
+    pair = (symbol_a, symbol_b)
+    
+    # Calculate metrics
+    metrics = _calculate_metrics_sync(symbol_a, symbol_b, limit)
+    
+    if not metrics:
+        stale = _stale_response(pair)
+        if stale:
+            return stale
+        return {"error": "Failed to calculate metrics"}, 500
+    
+    # Call Qwen3 analyzer
+    app.logger.info("Analyzing %s/%s with Qwen3", symbol_a, symbol_b)
+    
+    if not qwen_analyzer:
+        return {"error": "Qwen3 analyzer not initialized"}, 503
+    
+    try:
+        # One metrics dict serves the prompt, the cache entry and the response
+        metrics_out = {key: metrics.get(key) for key in _METRIC_KEYS}
+        
+        # The worker gets the same deadline, so an abandoned call does not hold a pool thread
+        analysis_result = _QWEN_POOL.submit(
+            qwen_analyzer.analyze_pair,
+            {**metrics_out, "symbolA": symbol_a, "symbolB": symbol_b},
+            temperature=0.3,
+            deadline=time.monotonic() + QWEN_TIMEOUT_SECONDS,
+        ).result(timeout=QWEN_TIMEOUT_SECONDS)
+        _UPSTREAM_BREAKER.record_success()
+        
+        return _store_result(symbol_a, symbol_b, metrics_out, analysis_result), 200
             
+    except FutureTimeoutError:
+        app.logger.error("Qwen3 analysis timed out after %.0fs", QWEN_TIMEOUT_SECONDS)
+        _UPSTREAM_BREAKER.record_failure()
+        stale = _stale_response(pair)
+        if stale:
+            return stale
+        return {"error": "Upstream analysis timed out"}, 504
+    except RuntimeError as e:
+        # Likely an upstream API failure (OpenRouter) or authentication issue
+        app.logger.error("Analysis failed: %s", e)
+        _UPSTREAM_BREAKER.record_failure()
+        traceback.print_exc()
+        stale = _stale_response(pair)
+        if stale:
+            return stale
+        # Return a clear 502/503 with guidance for missing/invalid API key
+        guidance = (
+            "OpenRouter request failed. Check OPENROUTER_API_KEY and account access. "
+            "If running on Render, add OPENROUTER_API_KEY as a secret in service settings."
+        )
+        return {"error": "Upstream analysis error", "details": str(e), "guidance": guidance}, 502
     except Exception as e:
-        app.logger.error(f"Endpoint error: {e}")
-        return jsonify({"error": str(e)}), 500
+        app.logger.error("Analysis failed: %s", e)
+        traceback.print_exc()
+        stale = _stale_response(pair)
+        if stale:
+            return stale
+        return {"error": f"Analysis error: {str(e)}"}, 500
+
+
+def _store_result(symbol_a: str, symbol_b: str, metrics_out: dict, analysis_result: dict) -> bytes:
+    """Build the /api/analyze payload for a fresh analysis, write it to both caches and return it encoded."""
+    analysis_data = {
+        "signal": analysis_result.get("signal", "NEUTRAL"),
+        "confidence": float(analysis_result.get("confidence", 0.5)),
+        "reasoning": analysis_result.get("reasoning", "No reasoning available"),
+        "risk_level": analysis_result.get("risk_level", "MEDIUM"),
+        "key_factors": analysis_result.get("key_factors", []),
+        "entry_recommendation": analysis_result.get("entry_recommendation", "Consult additional sources"),
+    }
+    
+    # Unparsed-response fallbacks are returned but kept out of both caches
+    fallback = analysis_result.get("fallback", False)
+    
+    # Cache the result
+    if cache_manager and not fallback:
+        try:
+            cache_manager.cache_analysis(
+                symbol_a,
+                symbol_b,
+                metrics_out,
+                analysis_data,
+                ttl_hours=CACHE_TTL_HOURS
+            )
+            app.logger.info("✓ Cached result for %s/%s", symbol_a, symbol_b)
+        except Exception as e:
+            app.logger.warning("Failed to cache: %s", e)
+    
+    result = {
+        "symbolA": symbol_a,
+        "symbolB": symbol_b,
+        "metrics": metrics_out,
+        "analysis": analysis_data,
+        "cached": False,
+    }
+    if not fallback:
+        # Later hits are served from the hot cache, so store the cached variant of the payload
+        now = datetime.utcnow()
+        _hot_cache_put((symbol_a, symbol_b), orjson.dumps({
+            **result,
+            "cached": True,
+            "cached_at": now.isoformat(),
+            "expires_at": (now + timedelta(hours=CACHE_TTL_HOURS)).isoformat(),
+        }))
+    return orjson.dumps(result)
 
 
 def _calculate_metrics_sync(symbol_a: str, symbol_b: str, limit: int) -> Optional[dict]:
     """Fetch real metrics from pair-agent API."""
-    import requests
-    
     pair_agent_base = os.getenv("AGENT_API_BASE", "https://pair-agent-a2ol.onrender.com")
     url = f"{pair_agent_base}/api/analyze"
     
@@ -267,15 +710,15 @@ def _calculate_metrics_sync(symbol_a: str, symbol_b: str, limit: int) -> Optiona
     }
     
     try:
-        app.logger.info(f"Fetching metrics from {url}")
-        response = requests.post(url, json=payload, timeout=30)
+        app.logger.info("Fetching metrics from %s", url)
+        response = _SESSION.post(url, json=payload, timeout=30)
         response.raise_for_status()
         
         data = response.json()
         analysis = data.get("analysis", {})
         
         if not analysis:
-            app.logger.error(f"No analysis data in response")
+            app.logger.error("No analysis data in response")
             return None
         
         # Derive a useful volatility value when not provided by upstream.
@@ -310,48 +753,62 @@ def _calculate_metrics_sync(symbol_a: str, symbol_b: str, limit: int) -> Optiona
         return metrics
         
     except Exception as e:
-        app.logger.error(f"Failed to fetch metrics: {e}")
-        # Fallback to mock
-        import random
-        return {
-            "zScore": random.uniform(-3.0, 3.0),
-            "corr": random.uniform(0.5, 0.95),
-            "mean": random.uniform(-0.01, 0.01),
-            "std": random.uniform(0.001, 0.01),
-            "beta": random.uniform(0.8, 1.5),
-            "volatility": random.uniform(0.01, 0.05),
-            "currentSpread": None,
-            "halfLife": None,
-            "cointegrationPValue": None,
-            "isCointegrated": None,
-            "sharpe": None,
-            "signalType": None,
-            "dataPoints": limit,
-        }
+        app.logger.error("Failed to fetch metrics: %s", e)
+        # No made-up metrics: callers fall back to the last good (stale) payload
+        return None
 
 
+def _hot_cache_get(pair: Tuple[str, str]) -> Optional[Tuple[float, bytes]]:
+    """Return the (stored_at, JSON bytes) hot-cache entry for a pair, if any."""
+    with _HOT_CACHE_LOCK:
+        return _HOT_CACHE.get(pair)
+
+
+def _hot_cache_put(pair: Tuple[str, str], raw: bytes) -> None:
+    """Remember the latest good payload (encoded JSON) for a pair."""
+    with _HOT_CACHE_LOCK:
+        _HOT_CACHE[pair] = (time.monotonic(), raw)
+
+
+def _stale_response(pair: Tuple[str, str]) -> Optional[Tuple[dict, int]]:
+    """Return the last known good payload for a pair, flagged as stale, if one exists."""
+    hot = _hot_cache_get(pair)
+    if not hot:
+        return None
+    stored_at, raw = hot
+    app.logger.warning("Serving stale analysis for %s/%s (%.0fs old)", pair[0], pair[1], time.monotonic() - stored_at)
+    # Rare path: decode so the payload can be flagged
+    return {**orjson.loads(raw), "cached": "stale"}, 200
+
+
+_PERP = "-PERP"
+
+
+@lru_cache(maxsize=128)
 def _ensure_perp(symbol: str) -> str:
     """Ensure symbol has -PERP suffix."""
+    # Already normalized: skip the upper() allocation
+    if symbol.endswith(_PERP) and symbol.isupper():
+        return symbol
     upper = symbol.upper()
-    return upper if upper.endswith("-PERP") else f"{upper}-PERP"
+    return upper if upper.endswith(_PERP) else upper + _PERP
 
 
-def main():
-    """Start both agent and API server in one process."""
+def init_services() -> None:
+    """Initialize the database cache and the Qwen3 analyzer for this process."""
     global qwen_analyzer, cache_manager
     
-    print("=" * 60)
-    print("ELARA Combined Server - Agent + API")
-    print("=" * 60)
-    
     # Initialize cache
     print("\n📦 Initializing database cache...")
     cache_manager = get_cache_manager()
     if cache_manager:
         try:
-            deleted = cache_manager.cleanup_expired()
-            if deleted > 0:
-                print(f"   ✓ Cleaned up {deleted} expired entries")
+            if cache_manager.cleanup_scheduled:
+                print("   ✓ Expired entries cleaned up by pg_cron")
+            else:
+                deleted = cache_manager.cleanup_expired()
+                if deleted > 0:
+                    print(f"   ✓ Cleaned up {deleted} expired entries")
             stats = cache_manager.get_cache_stats()
             print(f"   ✓ Cache ready: {stats['valid_entries']} valid entries")
         except Exception as e:
@@ -360,13 +817,15 @@ def main():
     # Initialize Qwen3
     print("\n🤖 Initializing Qwen3 analyzer...")
     try:
-        qwen_analyzer = Qwen3Analyzer()
+        qwen_analyzer = get_qwen()
         print(f"   ✓ Qwen3 ready (model: {qwen_analyzer.model_name})")
     except Exception as e:
         print(f"   ✗ Failed to initialize Qwen3: {e}")
         raise SystemExit(1)
-    
-    # Start agent in background
+
+
+def start_bureau() -> threading.Thread:
+    """Run the analyzer agent's Bureau in a background daemon thread."""
     print(f"\n🚀 Starting analyzer agent on port {AGENT_PORT}...")
     bureau = Bureau(port=AGENT_PORT)
     bureau.add(analyzer_agent)
@@ -374,9 +833,21 @@ def main():
     print(f"   Agent address: {analyzer_agent.address}")
     print(f"   Agent port: {AGENT_PORT}")
     
-    # Run bureau in background thread
     bureau_thread = threading.Thread(target=bureau.run, daemon=True)
     bureau_thread.start()
+    return bureau_thread
+
+
+def main():
+    """Start both agent and API server in one process."""
+    configure_logging()
+    
+    print("=" * 60)
+    print("ELARA Combined Server - Agent + API")
+    print("=" * 60)
+    
+    init_services()
+    start_bureau()
     
     # Give agent time to initialize
     time.sleep(2)
@@ -390,8 +861,13 @@ def main():
     print("✅ ELARA is ready! Both services running.")
     print("=" * 60 + "\n")
     
-    # Run Flask (this blocks)
-    app.run(host=API_HOST, port=API_PORT, debug=DEBUG)
+    # Run the API server (this blocks). A single process only: the agent lives here too.
+    # For multiple workers use gunicorn: gunicorn -c gunicorn_conf.py combined_server:app
+    if API_SERVER == "uvicorn":
+        import uvicorn
+        uvicorn.run(asgi_app, host=API_HOST, port=API_PORT, log_level="debug" if DEBUG else "info")
+    else:
+        app.run(host=API_HOST, port=API_PORT, debug=DEBUG)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+"""Gunicorn configuration for the combined ELARA server.
+
+Usage:
+    gunicorn -c gunicorn_conf.py combined_server:app
+
+Every worker serves the Flask API; exactly one worker (whichever takes the
+lock file first) also runs the analyzer agent's Bureau, since the agent
+binds a fixed port. Workers initialize the cache concurrently; its schema
+migration is serialized by a Postgres advisory lock (see CacheManager).
+"""
+from __future__ import annotations
+
+import os
+import fcntl
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('PORT', os.getenv('FLASK_PORT', '10000'))}"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+# Threaded workers: requests block on upstream I/O without starving the worker,
+# and the Bureau's asyncio loop and the psycopg pool stay on real threads
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+# Qwen3 analyses can take tens of seconds
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+BUREAU_LOCK_FILE = os.getenv("BUREAU_LOCK_FILE", "/tmp/elara-bureau.lock")
+
+# Held open for the worker's lifetime; the OS releases the lock when it exits
+_bureau_lock = None
+
+
+def post_worker_init(worker):
+    """Initialize services in each worker and start the Bureau in one of them."""
+    global _bureau_lock
+    import combined_server
+    from log_config import configure_logging
+    
+    configure_logging()
+    combined_server.init_services()
+    
+    lock = open(BUREAU_LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        worker.log.info("Analyzer agent already running in another worker")
+        return
+    
+    _bureau_lock = lock
+    combined_server.start_bureau()
+    worker.log.info("Analyzer agent started in worker %s", worker.pid)
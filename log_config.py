@@ -0,0 +1,39 @@
+"""Process-wide logging setup.
+
+Log records are handed to a queue and written to stderr by a background
+listener thread, so request handlers never block on console I/O.
+"""
+from __future__ import annotations
+
+import os
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """Configure root logging once (safe to call from every entry point)."""
+    global _listener
+
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logging.basicConfig(
+        level=level or os.getenv("LOG_LEVEL", "INFO"),
+        handlers=[QueueHandler(log_queue)],
+        force=True,
+    )
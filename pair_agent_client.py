@@ -15,26 +15,45 @@ The base URL can be overridden via the AGENT_API_BASE environment variable.
 from __future__ import annotations
 
 import os
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 import requests
 from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# Module-wide keep-alive session so repeated calls reuse pooled connections
+_SESSION = requests.Session()
+# "br" is decoded transparently by urllib3 when the brotli package is installed
+_SESSION.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, br"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=frozenset({"GET", "POST"}),
+    ),
+))
+
+
 def _base() -> str:
     return os.environ.get("AGENT_API_BASE", "https://pair-agent-a2ol.onrender.com").rstrip("/")
 
 
 def _get(url: str, timeout: int = 10) -> Any:
-    resp: Response = requests.get(url, timeout=timeout)
+    resp: Response = _SESSION.get(url, timeout=timeout)
     resp.raise_for_status()
     return resp.json()
 
 
 def _post(url: str, json: dict, timeout: int = 20) -> Any:
-    resp: Response = requests.post(url, json=json, timeout=timeout)
+    resp: Response = _SESSION.post(url, json=json, timeout=timeout)
     resp.raise_for_status()
     return resp.json()
 
@@ -67,6 +86,38 @@ def post_analyze(symbolA: str, symbolB: str, limit: int = 200, timeout: int = 20
     return _post(f"{_base()}/api/analyze", body, timeout=timeout)
 
 
+# (key, bound format method, default) for the numeric fields of fmt_trade / fmt_performance
+_TRADE_FIELDS = (
+    ("upnlPct", "{:+.4f}%".format, "N/A"),
+    ("correlation", "{:.4f}".format, "N/A"),
+    ("zScore", "{:.4f}".format, "N/A"),
+    ("spread", "{:.4f}".format, "N/A"),
+    ("beta", "{:.4f}".format, "N/A"),
+    ("volatility", "{:.4f}".format, "N/A"),
+    ("longPrice", "{:.4f}".format, "N/A"),
+    ("shortPrice", "{:.4f}".format, "N/A"),
+)
+
+_PERFORMANCE_FIELDS = (
+    ("winRate", "{:.2f}".format, "0.00"),
+    ("totalReturnPct", "{:.4f}".format, "N/A"),
+    ("totalReturnPctLeveraged", "{:.4f}".format, "N/A"),
+    ("avgTradeDurationHours", "{:.2f}".format, "N/A"),
+    ("profitFactor", "{:.4f}".format, "N/A"),
+    ("estimatedAPY", "{:.2f}".format, "N/A"),
+    ("estimatedAPYLeveraged", "{:.2f}".format, "N/A"),
+)
+
+
+def _format_fields(d: dict, fields: tuple) -> Dict[str, str]:
+    """Format the numeric fields of d in one pass, using each field's default when missing."""
+    out = {}
+    for key, fmt, default in fields:
+        v = d.get(key)
+        out[key] = fmt(float(v)) if v is not None else default
+    return out
+
+
 def fmt_trade(t: dict) -> str:
     """Format a trade dict into a readable multiline string."""
     if not isinstance(t, dict):
@@ -78,56 +129,44 @@ def fmt_trade(t: dict) -> str:
     ts = t.get("timestamp")
     if ts:
         try:
-            from datetime import datetime
-
             ts = datetime.fromisoformat(ts).isoformat(sep=" ", timespec="seconds")
         except Exception:
             ts = str(ts)
     else:
         ts = "N/A"
 
-    upnl = t.get("upnlPct")
-    upnl_str = f"{float(upnl):+.4f}%" if upnl is not None else "N/A"
-    corr = f"{float(t.get('correlation')):.4f}" if t.get("correlation") is not None else "N/A"
-    z = f"{float(t.get('zScore')):.4f}" if t.get("zScore") is not None else "N/A"
+    f = _format_fields(t, _TRADE_FIELDS)
     status = (t.get("status") or "open").upper()
     action = t.get("action") or t.get("signal") or "N/A"
-    spread = f"{float(t.get('spread')):.4f}" if t.get("spread") is not None else "N/A"
-    beta = f"{float(t.get('beta')):.4f}" if t.get("beta") is not None else "N/A"
-    vol = f"{float(t.get('volatility')):.4f}" if t.get("volatility") is not None else "N/A"
-    longPrice = f"{float(t.get('longPrice')):.4f}" if t.get("longPrice") is not None else "N/A"
-    shortPrice = f"{float(t.get('shortPrice')):.4f}" if t.get("shortPrice") is not None else "N/A"
 
     pair_display = t.get("pair") or f"{clean(t.get('symbolA'))}/{clean(t.get('symbolB'))}"
     long_asset = clean(t.get("longAsset")) or "N/A"
     short_asset = clean(t.get("shortAsset")) or "N/A"
 
-    lines = [
-        f"━━━ {pair_display} (ID: {t.get('id','N/A')}) ━━━",
-        f"📊 Status: {status} | ⏱️ Timeframe: 1hr",
-        f"⚡ Action: {action}",
-        f"📈 Z-Score: {z} | Corr: {corr} | Beta: {beta}",
-        f"💰 Unrealized PnL: {upnl_str}",
-        f"📉 Spread: {spread} | Volatility: {vol}",
-        f"💵 Long {long_asset}: {longPrice} | Short {short_asset}: {shortPrice}",
-        f"🕐 Opened: {ts}",
-    ]
+    text = f"""━━━ {pair_display} (ID: {t.get('id','N/A')}) ━━━
+📊 Status: {status} | ⏱️ Timeframe: 1hr
+⚡ Action: {action}
+📈 Z-Score: {f['zScore']} | Corr: {f['correlation']} | Beta: {f['beta']}
+💰 Unrealized PnL: {f['upnlPct']}
+📉 Spread: {f['spread']} | Volatility: {f['volatility']}
+💵 Long {long_asset}: {f['longPrice']} | Short {short_asset}: {f['shortPrice']}
+🕐 Opened: {ts}"""
 
     if t.get("reason"):
-        lines.append(f"💡 Reason: {t.get('reason')}")
+        text += f"\n💡 Reason: {t.get('reason')}"
 
     if t.get("closeTimestamp"):
-        lines.append(f"🕑 Closed: {t.get('closeTimestamp')}")
+        text += f"\n🕑 Closed: {t.get('closeTimestamp')}"
         if t.get("closeReason"):
-            lines.append(f"🔚 Close Reason: {t.get('closeReason')}")
+            text += f"\n🔚 Close Reason: {t.get('closeReason')}"
         if t.get("closePnL") is not None:
             try:
                 cp = float(t.get("closePnL"))
-                lines.append(f"💸 Close PnL: {cp:.4f}%")
+                text += f"\n💸 Close PnL: {cp:.4f}%"
             except Exception:
-                lines.append(f"💸 Close PnL: {t.get('closePnL')}")
+                text += f"\n💸 Close PnL: {t.get('closePnL')}"
 
-    return "\n".join(lines)
+    return text
 
 
 def fmt_performance(p: Optional[dict]) -> str:
@@ -140,36 +179,27 @@ def fmt_performance(p: Optional[dict]) -> str:
     winning_trades = p.get("winningTrades", 0)
     losing_trades = p.get("losingTrades", 0)
 
-    win_rate = f"{float(p.get('winRate')):.2f}" if p.get("winRate") is not None else "0.00"
-    total_return = f"{float(p.get('totalReturnPct')):.4f}" if p.get("totalReturnPct") is not None else "N/A"
-    total_return_lev = f"{float(p.get('totalReturnPctLeveraged')):.4f}" if p.get("totalReturnPctLeveraged") is not None else "N/A"
-    avg_duration = f"{float(p.get('avgTradeDurationHours')):.2f}" if p.get("avgTradeDurationHours") is not None else "N/A"
-    profit_factor = f"{float(p.get('profitFactor')):.4f}" if p.get("profitFactor") is not None else "N/A"
-    apy = f"{float(p.get('estimatedAPY')):.2f}" if p.get("estimatedAPY") is not None else "N/A"
-    apy_lev = f"{float(p.get('estimatedAPYLeveraged')):.2f}" if p.get("estimatedAPYLeveraged") is not None else "N/A"
-
+    f = _format_fields(p, _PERFORMANCE_FIELDS)
     last_updated = p.get("lastUpdated") or "N/A"
 
-    return "\n".join([
-        "━━━━━━ 📊 PERFORMANCE SUMMARY ━━━━━━",
-        "",
-        "📈 Trade Statistics:",
-        f"   Total Trades: {total_trades} ({open_trades} open, {closed_trades} closed)",
-        f"   Winning: {winning_trades} | Losing: {losing_trades}",
-        f"   Win Rate: {win_rate}%",
-        "",
-        "💰 Returns:",
-        f"   Total Return: {total_return}%",
-        f"   Total Return (Leveraged): {total_return_lev}%",
-        f"   Estimated APY: {apy}%",
-        f"   Estimated APY (Leveraged): {apy_lev}%",
-        "",
-        "📉 Risk Metrics:",
-        f"   Profit Factor: {profit_factor}",
-        f"   Avg Trade Duration: {avg_duration} hours",
-        "",
-        f"🕐 Last Updated: {last_updated}",
-    ])
+    return f"""━━━━━━ 📊 PERFORMANCE SUMMARY ━━━━━━
+
+📈 Trade Statistics:
+   Total Trades: {total_trades} ({open_trades} open, {closed_trades} closed)
+   Winning: {winning_trades} | Losing: {losing_trades}
+   Win Rate: {f['winRate']}%
+
+💰 Returns:
+   Total Return: {f['totalReturnPct']}%
+   Total Return (Leveraged): {f['totalReturnPctLeveraged']}%
+   Estimated APY: {f['estimatedAPY']}%
+   Estimated APY (Leveraged): {f['estimatedAPYLeveraged']}%
+
+📉 Risk Metrics:
+   Profit Factor: {f['profitFactor']}
+   Avg Trade Duration: {f['avgTradeDurationHours']} hours
+
+🕐 Last Updated: {last_updated}"""
 
 
 if __name__ == "__main__":
@@ -6,70 +6,43 @@ Provides structured prompts for trade pair analysis with strong reasoning.
 from __future__ import annotations
 
 import os
+import re
+import math
 import json
-from typing import Dict, Any, Optional
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
+import httpx
+import msgspec
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from cachetools import TTLCache
 
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
+# OpenRouter settings, read once at import (after load_dotenv)
+_DEFAULT_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+_DEFAULT_MODEL = os.getenv("QWEN_MODEL", "qwen/qwen3-max")
+_DEFAULT_REFERER = os.getenv("OPENROUTER_REFERER", "https://github.com/pair-agentverse")
+_DEFAULT_TITLE = os.getenv("OPENROUTER_TITLE", "ELARA Trade Analyzer")
 
-class Qwen3Analyzer:
-    """Trade analysis client using Qwen3 via OpenRouter API."""
-    
-    def __init__(
-        self,
-        model_name: str = None,
-        openrouter_api_key: str = None,
-    ):
-        """Initialize Qwen3 client with OpenRouter.
-        
-        Args:
-            model_name: Model identifier (e.g., "qwen/qwen3-max")
-            openrouter_api_key: OpenRouter API key (or use OPENROUTER_API_KEY env var)
-        """
-        self.openrouter_api_key = openrouter_api_key or os.getenv("OPENROUTER_API_KEY")
-        self.openrouter_base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
-        self.model_name = model_name or os.getenv("QWEN_MODEL", "qwen/qwen3-max")
-        
-        if not self.openrouter_api_key:
-            raise RuntimeError("OpenRouter API key not configured. Set OPENROUTER_API_KEY environment variable.")
-    
-    def _build_analysis_prompt(self, metrics: Dict[str, Any]) -> str:
-        """Build structured prompt for trade analysis."""
-        symbolA = metrics.get("symbolA", "UNKNOWN")
-        symbolB = metrics.get("symbolB", "UNKNOWN")
-        z_score = metrics.get("zScore", 0.0)
-        correlation = metrics.get("corr", 0.0)
-        spread_mean = metrics.get("mean", 0.0)
-        spread_std = metrics.get("std", 0.0)
-        beta = metrics.get("beta", 1.0)
-        volatility = metrics.get("volatility", 0.0)
-        # Optional extended metrics (may be None)
-        current_spread = metrics.get("currentSpread")
-        half_life = metrics.get("halfLife")
-        sharpe = metrics.get("sharpe")
-        signal_type = metrics.get("signalType")
-        
-        
-        prompt = f"""You are an expert cryptocurrency pairs trading analyst. Analyze the following trading pair metrics and provide detailed reasoning.
-
-**Trading Pair:** {symbolA} / {symbolB}
-
-**Statistical Metrics:**
-- Z-Score: {z_score:.4f}
-- Correlation: {correlation:.4f}
-- Spread Mean: {spread_mean:.6f}
-- Spread Std Dev: {spread_std:.6f}
-- Beta (hedge ratio): {beta:.4f}
-- Volatility: {volatility:.4f}
 
-**Additional Metrics (if available):**
-{('- Current Spread: ' + str(current_spread)) if current_spread is not None else ''}
-{('- Half-life: ' + str(half_life)) if half_life is not None else ''}
-{('- Sharpe: ' + str(sharpe)) if sharpe is not None else ''}
-{('- Upstream signal: ' + str(signal_type)) if signal_type is not None else ''}
+# Static instructions sent as the system message on every call. This block must
+# stay identical between requests so providers can serve it from their prompt cache,
+# and it is kept above the 1024-token minimum prefix that providers will cache.
+# The definitions are reference material only; the rubric matches the original
+# single-call prompt, and response-shape instructions live in the user prompts.
+SYSTEM_PROMPT = """You are an expert cryptocurrency pairs trading analyst. Analyze the trading pair metrics provided by the user and provide detailed reasoning.
 
 **Analysis Requirements:**
 1. **Signal Strength**: Evaluate if Z-score indicates a trading opportunity (typically |Z| > 2.0 suggests mean reversion opportunity)
@@ -78,109 +51,851 @@ class Qwen3Analyzer:
 4. **Trading Recommendation**: Provide clear LONG/SHORT/NEUTRAL recommendation with confidence level
 5. **Reasoning**: Explain the statistical rationale step-by-step
 
-**Output Format (JSON):**
+**Input Format:**
+The user message contains the metrics of one or more trading pairs. Each pair is described by a block with the following parts, in this order:
+
+1. A "Trading Pair" line naming symbol A and symbol B, separated by a slash.
+2. A "Statistical Metrics" list with the Z-score, correlation, spread mean, spread standard deviation, beta and volatility. These six values are always present.
+3. An "Additional Metrics" list with any optional values the upstream service supplied. The list may be empty.
+
+When several pairs are sent together, each block is preceded by a "Pair N" heading, where N counts from 1. The blocks are independent of each other: the metrics of one pair say nothing about another pair, even when the pairs share a symbol. The user message ends with the instructions for the response, including whether a single analysis object or a list of analysis objects is expected.
+
+**Metric Definitions:**
+The metrics are computed by an upstream service from aligned closing prices of the two symbols over a recent window of candles. Symbol A is always the first symbol of the pair and symbol B the second. The definitions below describe what each value measures; they are reference material only and do not change the requirements above.
+
+- Trading Pair: written as "A / B". Every directional statement in the analysis refers to this orientation, so "long the spread" means long symbol A and short symbol B, and "short the spread" means short symbol A and long symbol B.
+- Spread: the series obtained by subtracting beta times the price of symbol B from the price of symbol A at each point of the window. It is the quantity whose mean reversion a pairs trade relies on.
+- Z-Score: the distance of the latest spread value from the spread mean, measured in spread standard deviations. A value of 0 means the spread sits exactly at its mean; positive values mean the spread is above its mean and negative values mean it is below. The sign and the magnitude are both meaningful.
+- Correlation: the Pearson correlation coefficient between the two price series over the window. It lies between -1 and 1, where 1 means the two series move together perfectly, 0 means no linear relationship and -1 means they move in exactly opposite directions.
+- Spread Mean: the arithmetic mean of the spread over the window.
+- Spread Std Dev: the standard deviation of the spread over the window, in the same units as the spread mean. It is the unit in which the Z-score is expressed.
+- Beta (hedge ratio): the hedge ratio estimated by the upstream service over the window. It is the number of units of symbol B that offset one unit of symbol A in the spread.
+- Volatility: the volatility reported by the upstream service for the pair over the window. When the upstream service does not report it, the spread standard deviation is supplied in its place.
+- Current Spread: the latest value of the spread, in the same units as the spread mean.
+- Half-life: the estimated number of candles it takes a deviation of the spread from its mean to decay by half, as estimated by the upstream service.
+- Cointegration p-value: the p-value of a cointegration test on the two price series. Smaller values mean stronger statistical evidence that the spread is stationary.
+- Cointegrated: whether the upstream service considers the pair cointegrated at its configured significance level.
+- Sharpe: the Sharpe ratio reported by the upstream service for the spread over the window.
+- Upstream signal: the signal type computed by the upstream service from its own rules. It is an independent opinion and is supplied for context.
+
+Additional metrics are optional. Any of them may be missing from a request, in which case the corresponding line is left out of the metrics block. Numbers are rounded for display and the same window is used for every metric of a pair.
+
+**Analysis Object Fields:**
+Each analysis is a JSON object with exactly the fields below. Field names are case sensitive and no other fields are expected.
+
+- signal: one of the strings "LONG", "SHORT" or "NEUTRAL", in upper case. "LONG" means long the spread (long symbol A, short symbol B), "SHORT" means short the spread (short symbol A, long symbol B) and "NEUTRAL" means no position.
+- confidence: a number from 0.0 to 1.0 expressing how strongly the metrics support the signal, where 0.0 is no support and 1.0 is complete support. It is a plain JSON number, not a string or a percentage.
+- reasoning: a single string containing the detailed explanation with statistical justification. It should refer to the metric values it relies on. Newlines inside the string must be escaped as in any JSON string.
+- risk_level: one of the strings "LOW", "MEDIUM" or "HIGH", in upper case.
+- key_factors: a JSON array of short strings, each naming one factor that drove the analysis, for example a metric and its value. It is an array even when there is only one factor.
+- entry_recommendation: a single string with specific guidance on entry timing for the pair in the orientation given above.
+
+All string values are plain text without Markdown formatting. All numbers use a dot as the decimal separator and carry no units or percent signs.
+
+**Analysis Object Schema (JSON):**
 ```json
-{{
+{
   "signal": "LONG" | "SHORT" | "NEUTRAL",
   "confidence": 0.0-1.0,
   "reasoning": "detailed explanation with statistical justification",
   "risk_level": "LOW" | "MEDIUM" | "HIGH",
   "key_factors": ["factor1", "factor2", ...],
   "entry_recommendation": "specific guidance on entry timing"
-}}
-```
+}
+```"""
+
+
+# Per-pair section of the user prompt, filled by Qwen3Analyzer._build_pair_block
+_PAIR_BLOCK_TEMPLATE = """**Trading Pair:** {symbolA} / {symbolB}
+
+**Statistical Metrics:**
+- Z-Score: {z_score:.4f}
+- Correlation: {correlation:.4f}
+- Spread Mean: {spread_mean:.6f}
+- Spread Std Dev: {spread_std:.6f}
+- Beta (hedge ratio): {beta:.4f}
+- Volatility: {volatility:.4f}
+
+**Additional Metrics (if available):**
+{extras}"""
+
+# (metrics key, prompt label) for the optional extended metrics
+_EXTRA_METRIC_LABELS = (
+    ("currentSpread", "Current Spread"),
+    ("halfLife", "Half-life"),
+    ("cointegrationPValue", "Cointegration p-value"),
+    ("isCointegrated", "Cointegrated"),
+    ("sharpe", "Sharpe"),
+    ("signalType", "Upstream signal"),
+)
+
+# Fields picked out of a partially streamed JSON analysis (the number must be complete)
+_STREAM_SIGNAL = re.compile(r'"signal"\s*:\s*"(LONG|SHORT|NEUTRAL)"')
+_STREAM_CONFIDENCE = re.compile(r'"confidence"\s*:\s*(\d+(?:\.\d+)?)\s*[,}\n]')
+
+# JSON extraction: a fenced block first, else the outermost object/array.
+# Arrays are matched too, since batch responses are JSON lists.
+_JSON_FENCE = re.compile(r"```(?:json)?\s*([\[{].*?[\]}])\s*```", re.DOTALL)
+_BRACE = re.compile(r"[\[{].*[\]}]", re.DOTALL)
+
+# Retry policy for OpenRouter calls, shared by _post_stream_with_retries (sync) and _post_with_retries (async)
+_RETRY_TOTAL = 5
+_RETRY_BACKOFF = 0.3
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Longest Retry-After honoured between attempts; longer requested waits are clamped to this
+_RETRY_AFTER_MAX = float(os.getenv("OPENROUTER_RETRY_AFTER_MAX", "10"))
 
-Provide your analysis now:"""
-        return prompt
+# (connect, read) timeouts for OpenRouter; the read timeout applies between streamed chunks
+OPENROUTER_TIMEOUT = (
+    float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("OPENROUTER_READ_TIMEOUT", "60")),
+)
+
+
+# Parsed single-pair analyses keyed on rounded metrics (see Qwen3Analyzer._result_key)
+_RESULT_CACHE: TTLCache = TTLCache(
+    maxsize=int(os.getenv("QWEN_RESULT_CACHE_SIZE", "4096")),
+    ttl=int(os.getenv("QWEN_RESULT_CACHE_TTL_SECONDS", "3600")),
+)
+_RESULT_CACHE_LOCK = threading.Lock()
+
+# (metrics key, rounding digits, default) for the values that shape a prompt
+_RESULT_KEY_FIELDS = (
+    ("zScore", 3, 0.0),
+    ("corr", 3, 0.0),
+    ("mean", 6, 0.0),
+    ("std", 6, 0.0),
+    ("beta", 3, 1.0),
+    ("volatility", 3, 0.0),
+    ("currentSpread", 6, None),
+    ("halfLife", 3, None),
+    ("cointegrationPValue", 4, None),
+    ("isCointegrated", 0, None),
+    ("sharpe", 3, None),
+)
+
+
+_SIGNALS = frozenset({"LONG", "SHORT", "NEUTRAL"})
+_FACTOR_SEPARATORS = re.compile(r"[,;\n]")
+_RISK_LEVELS = frozenset({"LOW", "MEDIUM", "HIGH"})
+
+
+class Analysis(msgspec.Struct):
+    """One parsed analysis; fields the model leaves out (or sends as null) take these defaults.
     
-    def _call_openrouter(self, prompt: str, temperature: float = 0.3, max_tokens: int = 1024) -> str:
-        """Call OpenRouter API for inference."""
+    Minor schema drift is normalized in __post_init__ rather than rejected, so
+    a valid signal is not thrown away over a malformed secondary field.
+    """
+    signal: Optional[str] = "NEUTRAL"
+    confidence: Optional[float] = 0.5
+    reasoning: Optional[str] = ""
+    risk_level: Optional[str] = "MEDIUM"
+    key_factors: Union[List[str], str, None] = []
+    entry_recommendation: Optional[str] = ""
+    
+    def __post_init__(self) -> None:
+        # Coerce out-of-range values to the defaults instead of rejecting the whole analysis
+        self.signal = (self.signal or "").upper()
+        if self.signal not in _SIGNALS:
+            self.signal = "NEUTRAL"
+        self.risk_level = (self.risk_level or "").upper()
+        if self.risk_level not in _RISK_LEVELS:
+            self.risk_level = "MEDIUM"
+        self.confidence = 0.5 if self.confidence is None else min(max(self.confidence, 0.0), 1.0)
+        self.reasoning = self.reasoning or ""
+        self.entry_recommendation = self.entry_recommendation or ""
+        # A single string ("a, b" or one factor per line) becomes a list
+        if isinstance(self.key_factors, str):
+            self.key_factors = [f.strip() for f in _FACTOR_SEPARATORS.split(self.key_factors) if f.strip()]
+        elif self.key_factors is None:
+            self.key_factors = []
+
+
+# Reusable decoders; strict=False accepts numbers the model quotes as strings
+_ANALYSIS_DECODER = msgspec.json.Decoder(Analysis, strict=False)
+_BATCH_DECODER = msgspec.json.Decoder(List[Analysis], strict=False)
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), if usable."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _result_key_value(value: Any, digits: int) -> Any:
+    """A metric as it goes into the result-cache key: finite numbers rounded, anything else as text.
+    
+    Upstream pass-through fields can be strings such as "N/A"; those are only
+    formatted into the prompt, so the cache key must not fail on them either.
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return round(float(value), digits)
+    return str(value)
+
+
+def _next_retry_delay(attempt: int, retry_after: Optional[str], deadline: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait before retry number ``attempt`` (1-based), or None to give up.
+    
+    A Retry-After header takes precedence over exponential backoff, clamped to
+    _RETRY_AFTER_MAX. With a deadline (a time.monotonic() value), no retry is
+    scheduled that would start after it.
+    """
+    if attempt > _RETRY_TOTAL:
+        return None
+    delay = _retry_after_seconds(retry_after)
+    delay = _RETRY_BACKOFF * 2 ** (attempt - 1) if delay is None else min(delay, _RETRY_AFTER_MAX)
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def _attempt_timeout(deadline: Optional[float]) -> Tuple[float, float]:
+    """(connect, read) timeouts for one OpenRouter attempt, capped at the time left before the deadline."""
+    if deadline is None:
+        return OPENROUTER_TIMEOUT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise RuntimeError("OpenRouter call deadline passed")
+    return min(OPENROUTER_TIMEOUT[0], remaining), min(OPENROUTER_TIMEOUT[1], remaining)
+
+
+def cached_prompt_tokens(usage: Optional[Dict[str, Any]]) -> int:
+    """Number of prompt tokens served from the provider's prompt cache.
+    
+    OpenRouter reports this as ``prompt_tokens_details.cached_tokens``;
+    Anthropic-style usage uses ``cache_read_input_tokens``.
+    """
+    if not usage:
+        return 0
+    details = usage.get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or usage.get("cache_read_input_tokens") or 0)
+
+
+class Qwen3Analyzer:
+    """Trade analysis client using Qwen3 via OpenRouter API."""
+    
+    def __init__(
+        self,
+        model_name: str = None,
+        openrouter_api_key: str = None,
+    ):
+        """Initialize Qwen3 client with OpenRouter.
+        
+        Args:
+            model_name: Model identifier (e.g., "qwen/qwen3-max")
+            openrouter_api_key: OpenRouter API key (or use OPENROUTER_API_KEY env var)
+        """
+        self.openrouter_api_key = openrouter_api_key or os.getenv("OPENROUTER_API_KEY")
+        self.openrouter_base_url = _DEFAULT_BASE_URL
+        self.model_name = model_name or _DEFAULT_MODEL
+        # Async client for the *_async methods, created lazily on the calling event loop
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        
         if not self.openrouter_api_key:
             raise RuntimeError("OpenRouter API key not configured. Set OPENROUTER_API_KEY environment variable.")
         
-        url = f"{self.openrouter_base_url}/chat/completions"
-        headers = {
+        # The system message depends only on the model, so it is built once and shared
+        self._system_message = self._build_system_message()
+        
+        # Request bodies are pre-serialized with orjson, so Content-Type must be set here
+        self._headers = {
             "Authorization": f"Bearer {self.openrouter_api_key}",
             "Content-Type": "application/json",
-            "HTTP-Referer": os.getenv("OPENROUTER_REFERER", "https://github.com/pair-agentverse"),
-            "X-Title": os.getenv("OPENROUTER_TITLE", "ELARA Trade Analyzer"),
+            "Accept-Encoding": "gzip, br",
+            "HTTP-Referer": _DEFAULT_REFERER,
+            "X-Title": _DEFAULT_TITLE,
         }
         
+        # Keep-alive session so consecutive calls skip the TCP+TLS handshake.
+        # Retries are done by _post_stream_with_retries, which can respect a deadline.
+        self._session = requests.Session()
+        self._session.headers.update(self._headers)
+        self._session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+    
+    def close(self) -> None:
+        """Close the pooled HTTP session."""
+        self._session.close()
+    
+    def __enter__(self) -> "Qwen3Analyzer":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
+    def _build_pair_block(self, metrics: Dict[str, Any]) -> str:
+        """Build the pair and metrics section of the per-request prompt."""
+        # Optional extended metrics are listed only when present
+        extras = "\n".join(
+            f"- {label}: {metrics[key]}"
+            for key, label in _EXTRA_METRIC_LABELS
+            if metrics.get(key) is not None
+        )
+        return _PAIR_BLOCK_TEMPLATE.format_map({
+            "symbolA": metrics.get("symbolA", "UNKNOWN"),
+            "symbolB": metrics.get("symbolB", "UNKNOWN"),
+            "z_score": metrics.get("zScore", 0.0),
+            "correlation": metrics.get("corr", 0.0),
+            "spread_mean": metrics.get("mean", 0.0),
+            "spread_std": metrics.get("std", 0.0),
+            "beta": metrics.get("beta", 1.0),
+            "volatility": metrics.get("volatility", 0.0),
+            "extras": extras,
+        })
+    
+    def _build_analysis_prompt(self, metrics: Dict[str, Any]) -> str:
+        """Build the per-request part of the prompt for a single pair."""
+        return (
+            f"{self._build_pair_block(metrics)}\n\n"
+            f"Respond with a single analysis object in the schema described in the instructions.\n\n"
+            f"Provide your analysis now:"
+        )
+    
+    def _build_batch_prompt(self, metrics_list: List[Dict[str, Any]]) -> str:
+        """Build one prompt asking for a JSON array of analyses, one per pair."""
+        count = len(metrics_list)
+        blocks = "\n\n".join(
+            f"### Pair {i}\n{self._build_pair_block(metrics)}"
+            for i, metrics in enumerate(metrics_list, start=1)
+        )
+        return (
+            f"Analyze each of the following {count} trading pairs independently.\n\n"
+            f"{blocks}\n\n"
+            f"Respond with a JSON array of exactly {count} analysis objects in the same order "
+            f"as the pairs above, each using the schema described in the instructions."
+        )
+    
+    def _build_system_message(self) -> Dict[str, Any]:
+        """Build the static system message for this model.
+        
+        Keeping the static block first and byte-identical lets the provider reuse
+        its cached prefix. Anthropic models need an explicit cache breakpoint;
+        OpenAI/Gemini-style backends cache long prefixes automatically.
+        """
+        system_block: Dict[str, Any] = {"type": "text", "text": SYSTEM_PROMPT}
+        if self.model_name.startswith("anthropic/"):
+            system_block["cache_control"] = {"type": "ephemeral"}
+        return {"role": "system", "content": [system_block]}
+    
+    def _build_messages(self, prompt: str) -> List[Dict[str, Any]]:
+        """Build the chat messages: static system prompt first, then the per-request prompt."""
+        return [self._system_message, {"role": "user", "content": prompt}]
+    
+    def _build_request(self, prompt: str, temperature: float, max_tokens: int) -> Tuple[str, Dict[str, Any]]:
+        """Build the OpenRouter chat completions URL and payload."""
+        url = f"{self.openrouter_base_url}/chat/completions"
         payload = {
             "model": self.model_name,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
+            "messages": self._build_messages(prompt),
             "temperature": temperature,
             "max_tokens": max_tokens,
+            # Ask OpenRouter for detailed usage, including cached prompt tokens
+            "usage": {"include": True},
         }
+        return url, payload
+    
+    def _call_openrouter(
+        self,
+        prompt: str,
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+        deadline: Optional[float] = None,
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Call OpenRouter API for inference, returning (content, token usage).
         
+        The response is streamed and reading stops as soon as the fenced JSON
+        block has closed, so trailing commentary is never waited for. Usage is
+        reported in the final chunk, so it is None after such an early exit.
+        See _stream_openrouter for ``deadline``.
+        """
+        chunks: List[str] = []
+        usage: Dict[str, Any] = {}
+        stream = self._stream_openrouter(prompt, temperature, max_tokens, usage, deadline)
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=60)
+            for delta in stream:
+                chunks.append(delta)
+                # Only a delta carrying a backtick can complete the closing fence
+                if "`" in delta and _JSON_FENCE.search("".join(chunks)):
+                    break
+        finally:
+            # Closes the underlying response when we stop early
+            stream.close()
+        
+        content = "".join(chunks).strip()
+        if not content:
+            raise RuntimeError("OpenRouter returned an empty response")
+        return content, usage or None
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Return the shared AsyncClient, recreating it if the running event loop changed."""
+        loop = asyncio.get_running_loop()
+        if self._async_client is not None and self._async_loop is not loop:
+            self._close_stale_async_client()
+        if self._async_client is None:
+            # Connections are bound to the loop that opened them. HTTP/2 multiplexes
+            # the concurrent analyze_pairs_async calls over a few TLS connections.
+            self._async_client = httpx.AsyncClient(
+                http2=True,
+                headers=self._headers,
+                timeout=httpx.Timeout(OPENROUTER_TIMEOUT[1], connect=OPENROUTER_TIMEOUT[0]),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            )
+            self._async_loop = loop
+        return self._async_client
+    
+    async def _call_openrouter_async(
+        self, prompt: str, temperature: float = 0.3, max_tokens: int = 1024
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Call OpenRouter API without blocking the event loop, returning (content, token usage)."""
+        url, payload = self._build_request(prompt, temperature, max_tokens)
+        
+        try:
+            response = await self._post_with_retries(url, orjson.dumps(payload))
             response.raise_for_status()
             
-            result = response.json()
+            result = orjson.loads(response.content)
             
             if "choices" in result and len(result["choices"]) > 0:
                 content = result["choices"][0]["message"]["content"]
-                return content.strip()
+                return content.strip(), result.get("usage")
             else:
                 raise RuntimeError(f"Unexpected OpenRouter response format: {result}")
                 
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+            raise RuntimeError(f"OpenRouter API request failed: {e}")
+    
+    async def _post_with_retries(self, url: str, body: bytes) -> httpx.Response:
+        """POST on the async client with the same retry policy as the sync session.
+        
+        Connection errors and 429/5xx responses are retried up to _RETRY_TOTAL
+        times with exponential backoff; a Retry-After header takes precedence,
+        clamped to _RETRY_AFTER_MAX so a long server-requested wait cannot park
+        the caller. The last response (or error) is returned once retries are
+        exhausted.
+        """
+        client = self._get_async_client()
+        attempt = 0
+        while True:
+            try:
+                response = await client.post(url, content=body)
+            except httpx.TransportError:
+                delay = _next_retry_delay(attempt + 1, None)
+                if delay is None:
+                    raise
+            else:
+                if response.status_code not in _RETRY_STATUSES:
+                    return response
+                delay = _next_retry_delay(attempt + 1, response.headers.get("Retry-After"))
+                if delay is None:
+                    return response
+            
+            attempt += 1
+            logger.warning("OpenRouter call failed, retry %d/%d in %.1fs", attempt, _RETRY_TOTAL, delay)
+            await asyncio.sleep(delay)
+    
+    def _post_stream_with_retries(self, url: str, body: bytes, deadline: Optional[float]) -> requests.Response:
+        """Streaming POST on the sync session with the same retry policy as _post_with_retries.
+        
+        With a deadline, each attempt's timeouts are capped at the time left
+        and no retry is started that would begin after it. The last response
+        (or error) is returned once retries are exhausted.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self._session.post(url, data=body, timeout=_attempt_timeout(deadline), stream=True)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                delay = _next_retry_delay(attempt + 1, None, deadline)
+                if delay is None:
+                    raise
+            else:
+                if response.status_code not in _RETRY_STATUSES:
+                    return response
+                delay = _next_retry_delay(attempt + 1, response.headers.get("Retry-After"), deadline)
+                if delay is None:
+                    return response
+                response.close()
+            
+            attempt += 1
+            logger.warning("OpenRouter call failed, retry %d/%d in %.1fs", attempt, _RETRY_TOTAL, delay)
+            time.sleep(delay)
+    
+    def _close_stale_async_client(self) -> None:
+        """Close the AsyncClient left by a previous event loop, on that loop, before replacing it."""
+        client, old_loop = self._async_client, self._async_loop
+        self._async_client = None
+        self._async_loop = None
+        if old_loop is not None and old_loop.is_running():
+            # Another thread's loop: its transports can only be closed from there
+            asyncio.run_coroutine_threadsafe(client.aclose(), old_loop)
+        else:
+            # A stopped or closed loop can no longer run the close; its sockets go with it
+            logger.debug("Dropping AsyncClient of an event loop that is no longer running")
+    
+    async def aclose(self) -> None:
+        """Close the async HTTP client (call from the event loop that used it)."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+    
+    def _stream_openrouter(
+        self,
+        prompt: str,
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+        usage: Optional[Dict[str, Any]] = None,
+        deadline: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Call OpenRouter with server-sent events streaming, yielding content deltas.
+        
+        When ``usage`` is given, the token usage from the final chunk is copied
+        into it (it stays empty if the caller stops reading early). With a
+        ``deadline`` (a time.monotonic() value), retries and timeouts are fitted
+        into the time left, and the stream is closed with a RuntimeError once it
+        passes, so a caller that has given up does not leave the call running.
+        """
+        url, payload = self._build_request(prompt, temperature, max_tokens)
+        payload["stream"] = True
+        
+        try:
+            with self._post_stream_with_retries(url, orjson.dumps(payload), deadline) as response:
+                response.raise_for_status()
+                
+                # Lines stay bytes: orjson parses them directly, with no decode/re-encode
+                for line in response.iter_lines():
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise RuntimeError("OpenRouter call deadline passed")
+                    # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank lines
+                    if not line.startswith(b"data: "):
+                        continue
+                    data = line[len(b"data: "):]
+                    if data == b"[DONE]":
+                        break
+                    
+                    chunk = orjson.loads(data)
+                    if chunk.get("usage") and usage is not None:
+                        usage.update(chunk["usage"])
+                    for choice in chunk.get("choices", []):
+                        delta = (choice.get("delta") or {}).get("content")
+                        if delta:
+                            yield delta
+                            
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
             raise RuntimeError(f"OpenRouter API request failed: {e}")
     
-    def analyze_pair(self, metrics: Dict[str, Any], temperature: float = 0.3) -> Dict[str, Any]:
+    def analyze_pair(
+        self,
+        metrics: Dict[str, Any],
+        temperature: float = 0.3,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Any]:
         """Analyze trading pair using Qwen3 reasoning via OpenRouter.
         
         Args:
             metrics: Dict with symbolA, symbolB, zScore, corr, mean, std, beta, volatility
             temperature: Sampling temperature (lower = more deterministic)
+            deadline: time.monotonic() value after which the call (retries included) is abandoned
             
         Returns:
-            Dict with signal, confidence, reasoning, risk_level, key_factors, entry_recommendation
+            Dict with signal, confidence, reasoning, risk_level, key_factors, entry_recommendation,
+            plus the call's token ``usage`` when it was not served from the result cache
         """
+        key = self._result_key(metrics, temperature)
+        cached = self._get_cached_result(key)
+        if cached is not None:
+            return cached
+        
         prompt = self._build_analysis_prompt(metrics)
-        raw_response = self._call_openrouter(prompt, temperature)
+        raw_response, usage = self._call_openrouter(prompt, temperature, deadline=deadline)
+        return self._parse_and_cache(key, raw_response, usage)
+    
+    async def analyze_pair_async(self, metrics: Dict[str, Any], temperature: float = 0.3) -> Dict[str, Any]:
+        """Async version of analyze_pair."""
+        key = self._result_key(metrics, temperature)
+        cached = self._get_cached_result(key)
+        if cached is not None:
+            return cached
         
-        # Parse JSON response (extract from markdown code blocks if present)
-        try:
-            # Try to find JSON in code blocks
-            if "```json" in raw_response:
-                start = raw_response.index("```json") + 7
-                end = raw_response.index("```", start)
-                json_str = raw_response[start:end].strip()
-            elif "```" in raw_response:
-                start = raw_response.index("```") + 3
-                end = raw_response.index("```", start)
-                json_str = raw_response[start:end].strip()
-            else:
-                json_str = raw_response
-            
-            parsed = json.loads(json_str)
-            
-            # Validate required fields
-            required = ["signal", "confidence", "reasoning", "risk_level"]
-            for field in required:
-                if field not in parsed:
-                    parsed[field] = "UNKNOWN" if field != "confidence" else 0.5
+        prompt = self._build_analysis_prompt(metrics)
+        raw_response, usage = await self._call_openrouter_async(prompt, temperature)
+        return self._parse_and_cache(key, raw_response, usage)
+    
+    def _result_key(self, metrics: Dict[str, Any], temperature: float) -> tuple:
+        """Cache key for a single-pair analysis: everything that shapes the prompt, rounded.
+        
+        At low temperature the response for a given prompt is effectively
+        deterministic, so near-identical metrics reuse the earlier analysis.
+        """
+        values = [
+            _result_key_value(metrics.get(field, default), digits)
+            for field, digits, default in _RESULT_KEY_FIELDS
+        ]
+        return (
+            self.model_name,
+            temperature,
+            metrics.get("symbolA"),
+            metrics.get("symbolB"),
+            metrics.get("signalType"),
+            *values,
+        )
+    
+    @staticmethod
+    def _get_cached_result(key: tuple) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached analysis for key, if any."""
+        with _RESULT_CACHE_LOCK:
+            cached = _RESULT_CACHE.get(key)
+        return dict(cached) if cached is not None else None
+    
+    def _parse_and_cache(
+        self, key: tuple, raw_response: str, usage: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Parse a single-pair response, caching it unless it had to fall back."""
+        parsed = self._try_parse_analysis(raw_response)
+        if parsed is None:
+            parsed = self._fallback_analysis(raw_response)
+        else:
+            with _RESULT_CACHE_LOCK:
+                _RESULT_CACHE[key] = dict(parsed)
+        self._attach_usage([parsed], usage)
+        return parsed
+    
+    @staticmethod
+    def _attach_usage(analyses: List[Dict[str, Any]], usage: Optional[Dict[str, Any]]) -> None:
+        """Report a call's token usage on the analyses it produced (after they were cached).
+        
+        Usage travels with each result rather than on the shared analyzer, so
+        concurrent calls never see each other's numbers. Batched analyses share
+        their call's usage.
+        """
+        if usage:
+            for analysis in analyses:
+                analysis["usage"] = usage
+    
+    async def analyze_pairs_async(
+        self,
+        metrics_list: List[Dict[str, Any]],
+        temperature: float = 0.3,
+        concurrency: int = 16,
+    ) -> List[Dict[str, Any]]:
+        """Analyze several pairs with one concurrent OpenRouter call each.
+        
+        At most ``concurrency`` calls are in flight at once. Results are in
+        the same order as metrics_list.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def bounded(metrics: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.analyze_pair_async(metrics, temperature)
+        
+        return list(await asyncio.gather(*(bounded(metrics) for metrics in metrics_list)))
+    
+    def analyze_pairs(
+        self,
+        metrics_list: List[Dict[str, Any]],
+        temperature: float = 0.3,
+        max_workers: int = 16,
+    ) -> List[Dict[str, Any]]:
+        """Sync counterpart of analyze_pairs_async, with one worker thread per call.
+        
+        The calls are network-bound and release the GIL, and the worker threads
+        share the pooled session. Results are in the same order as metrics_list.
+        """
+        if not metrics_list:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(metrics_list))) as executor:
+            return list(executor.map(lambda metrics: self.analyze_pair(metrics, temperature), metrics_list))
+    
+    def analyze_pair_stream(self, metrics: Dict[str, Any], temperature: float = 0.3) -> Iterator[Dict[str, Any]]:
+        """Analyze a trading pair, yielding early results while Qwen3 is still generating.
+        
+        Yields a partial dict (``partial=True`` with signal and confidence) as
+        soon as both fields have been generated, then the complete analysis
+        (same shape as analyze_pair) once the response has finished.
+        """
+        key = self._result_key(metrics, temperature)
+        cached = self._get_cached_result(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        prompt = self._build_analysis_prompt(metrics)
+        chunks: List[str] = []
+        usage: Dict[str, Any] = {}
+        partial_sent = False
+        
+        for delta in self._stream_openrouter(prompt, temperature, usage=usage):
+            chunks.append(delta)
+            if partial_sent:
+                continue
             
-            return parsed
+            text = "".join(chunks)
+            signal = _STREAM_SIGNAL.search(text)
+            confidence = _STREAM_CONFIDENCE.search(text)
+            if signal and confidence:
+                partial_sent = True
+                yield {
+                    "signal": signal.group(1),
+                    "confidence": float(confidence.group(1)),
+                    "partial": True,
+                }
+        
+        yield self._parse_and_cache(key, "".join(chunks).strip(), usage)
+    
+    def _try_parse_analysis(self, raw_response: str) -> Optional[Dict[str, Any]]:
+        """Parse a single-pair analysis, or return None on bad JSON."""
+        try:
+            analysis = _ANALYSIS_DECODER.decode(self._extract_json(raw_response))
+        except msgspec.DecodeError as e:
+            logger.warning("Failed to parse JSON response: %s", e)
+            return None
+        return msgspec.to_builtins(analysis)
+    
+    @staticmethod
+    def _fallback_analysis(raw_response: str) -> Dict[str, Any]:
+        """NEUTRAL analysis wrapping a response that could not be parsed.
+        
+        Flagged with ``fallback`` so callers know not to cache it.
+        """
+        return {
+            "signal": "NEUTRAL",
+            "confidence": 0.5,
+            "reasoning": raw_response,
+            "risk_level": "MEDIUM",
+            "key_factors": [],
+            "entry_recommendation": "Manual review recommended",
+            "fallback": True,
+        }
+    
+    def analyze_pairs_batch(
+        self,
+        metrics_list: List[Dict[str, Any]],
+        temperature: float = 0.3,
+        deadline: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Analyze several trading pairs with a single OpenRouter call.
+        
+        Falls back to one call per pair if the model does not return a JSON
+        array with one analysis per pair.
+        
+        Args:
+            metrics_list: List of metrics dicts (same shape as for analyze_pair)
+            temperature: Sampling temperature (lower = more deterministic)
+            deadline: as for analyze_pair, shared by the per-pair fallback calls
             
-        except (json.JSONDecodeError, ValueError) as e:
-            # Fallback: return raw response with basic structure
-            print(f"[Qwen3] Failed to parse JSON response: {e}")
-            return {
-                "signal": "NEUTRAL",
-                "confidence": 0.5,
-                "reasoning": raw_response,
-                "risk_level": "MEDIUM",
-                "key_factors": [],
-                "entry_recommendation": "Manual review recommended"
-            }
+        Returns:
+            List of analysis dicts in the same order as metrics_list
+        """
+        if len(metrics_list) == 1:
+            return [self.analyze_pair(metrics_list[0], temperature, deadline)]
+        
+        prompt = self._build_batch_prompt(metrics_list)
+        raw_response, usage = self._call_openrouter(
+            prompt, temperature, max_tokens=1024 * len(metrics_list), deadline=deadline
+        )
+        
+        results = self._parse_batch(raw_response, len(metrics_list))
+        if results is not None:
+            self._cache_batch(metrics_list, temperature, results)
+            self._attach_usage(results, usage)
+            return results
+        return [self.analyze_pair(metrics, temperature, deadline) for metrics in metrics_list]
+    
+    def analyze_pairs_batched(
+        self,
+        metrics_list: List[Dict[str, Any]],
+        temperature: float = 0.3,
+        batch_size: int = 8,
+    ) -> List[Dict[str, Any]]:
+        """Analyze any number of pairs, packing up to ``batch_size`` pairs into each call.
+        
+        Pairs already in the result cache are served from it; the rest go
+        through analyze_pairs_batch in chunks. Results are in the same order
+        as metrics_list.
+        """
+        results = [
+            self._get_cached_result(self._result_key(metrics, temperature))
+            for metrics in metrics_list
+        ]
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            analyses = self.analyze_pairs_batch([metrics_list[i] for i in chunk], temperature)
+            for i, analysis in zip(chunk, analyses):
+                results[i] = analysis
+        return results
+    
+    async def analyze_pairs_batch_async(
+        self,
+        metrics_list: List[Dict[str, Any]],
+        temperature: float = 0.3,
+    ) -> List[Dict[str, Any]]:
+        """Async version of analyze_pairs_batch; the per-pair fallback runs concurrently."""
+        if len(metrics_list) == 1:
+            return [await self.analyze_pair_async(metrics_list[0], temperature)]
+        
+        prompt = self._build_batch_prompt(metrics_list)
+        raw_response, usage = await self._call_openrouter_async(prompt, temperature, max_tokens=1024 * len(metrics_list))
+        
+        results = self._parse_batch(raw_response, len(metrics_list))
+        if results is not None:
+            self._cache_batch(metrics_list, temperature, results)
+            self._attach_usage(results, usage)
+            return results
+        return await self.analyze_pairs_async(metrics_list, temperature)
+    
+    def _cache_batch(
+        self,
+        metrics_list: List[Dict[str, Any]],
+        temperature: float,
+        results: List[Dict[str, Any]],
+    ) -> None:
+        """Store parsed batch analyses in the single-pair result cache."""
+        with _RESULT_CACHE_LOCK:
+            for metrics, result in zip(metrics_list, results):
+                _RESULT_CACHE[self._result_key(metrics, temperature)] = dict(result)
+    
+    def _parse_batch(self, raw_response: str, count: int) -> Optional[List[Dict[str, Any]]]:
+        """Parse a batched response into ``count`` analyses, or None if it is unusable."""
+        try:
+            analyses = _BATCH_DECODER.decode(self._extract_json(raw_response))
+        except msgspec.DecodeError as e:
+            logger.warning("Failed to parse batch JSON response: %s", e)
+            return None
+        if len(analyses) != count:
+            logger.warning("Batch response did not contain %d analyses, retrying per pair", count)
+            return None
+        return [msgspec.to_builtins(analysis) for analysis in analyses]
+    
+    @staticmethod
+    def _extract_json(raw_response: str) -> str:
+        """Extract the JSON payload from a response (markdown code blocks if present)."""
+        match = _JSON_FENCE.search(raw_response)
+        if match:
+            return match.group(1)
+        match = _BRACE.search(raw_response)
+        return match.group(0) if match else raw_response
+
+
+@lru_cache(maxsize=1)
+def get_qwen() -> Qwen3Analyzer:
+    """Get the shared Qwen3 analyzer, creating it on first use.
+    
+    Raises RuntimeError if OpenRouter is not configured (failures are not cached).
+    """
+    return Qwen3Analyzer()
 
 
 # Convenience function
@@ -205,16 +920,12 @@ def analyze_trade_pair(
     metrics["symbolA"] = symbolA
     metrics["symbolB"] = symbolB
     
-    analyzer = Qwen3Analyzer(model_name=model_name)
-    return analyzer.analyze_pair(metrics)
+    with Qwen3Analyzer(model_name=model_name) as analyzer:
+        return analyzer.analyze_pair(metrics)
 
 
 if __name__ == "__main__":
-    # Load environment variables
-    from dotenv import load_dotenv
-    load_dotenv()
-    
-    # Smoke test
+    # Smoke test (.env is already loaded at import)
     test_metrics = {
         "symbolA": "BTC-PERP",
         "symbolB": "ETH-PERP",
@@ -0,0 +1,139 @@
+"""Drive the analyzer agent through uagents' own message dispatch.
+
+Messages are queued with Agent.handle_message and consumed by the agent's
+message-queue processor, so these tests exercise the same scheduling
+(sequential or concurrent handlers) as a running agent.
+"""
+import asyncio
+import uuid
+
+import pytest
+from uagents import Model
+from uagents.context import ExternalContext
+from uagents.crypto import Identity
+
+import analyzer_agent
+from analyzer_agent import AnalyzeRequest, analyzer_agent as agent
+
+SENDER = Identity.generate().address
+
+
+class FakeQwen:
+    """Records calls; each analysis takes `delay` seconds like a network round trip."""
+    model_name = "fake/model"
+    
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.single_calls = 0
+        self.batch_sizes = []
+    
+    def _analysis(self, metrics):
+        signal = "SHORT" if metrics["zScore"] > 0 else "LONG"
+        return {"signal": signal, "confidence": 0.8, "reasoning": "r", "risk_level": "LOW"}
+    
+    async def analyze_pair_async(self, metrics, temperature=0.3):
+        self.single_calls += 1
+        await asyncio.sleep(self.delay)
+        return self._analysis(metrics)
+    
+    async def analyze_pairs_batch_async(self, metrics_list, temperature=0.3):
+        self.batch_sizes.append(len(metrics_list))
+        await asyncio.sleep(self.delay)
+        return [self._analysis(metrics) for metrics in metrics_list]
+    
+    def analyze_pair_stream(self, metrics, temperature=0.3):
+        self.single_calls += 1
+        analysis = self._analysis(metrics)
+        yield {"signal": analysis["signal"], "confidence": analysis["confidence"], "partial": True}
+        yield analysis
+
+
+@pytest.fixture
+def fake_qwen(monkeypatch):
+    qwen = FakeQwen()
+    monkeypatch.setattr(analyzer_agent, "get_qwen", lambda: qwen)
+    monkeypatch.setattr(analyzer_agent, "get_cache_manager", lambda: None)
+    return qwen
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    messages = []
+    
+    async def record(self, destination, message, **kwargs):
+        messages.append((destination, message))
+    
+    monkeypatch.setattr(ExternalContext, "send", record)
+    return messages
+
+
+def _request(symbol_a: str, symbol_b: str, z_score: float = 2.5) -> AnalyzeRequest:
+    return AnalyzeRequest(
+        symbolA=symbol_a,
+        symbolB=symbol_b,
+        zScore=z_score,
+        correlation=0.85,
+        spread_mean=0.0012,
+        spread_std=0.0045,
+        beta=1.15,
+        volatility=0.023,
+    )
+
+
+async def _dispatch(requests, expected_replies, sent):
+    """Start the agent's handlers, dispatch requests through its queue and wait for the replies."""
+    await analyzer_agent.initialize_qwen(agent._build_context())
+    processor = asyncio.create_task(agent._process_message_queue())
+    try:
+        digest = Model.build_schema_digest(AnalyzeRequest)
+        for request in requests:
+            await agent.handle_message(SENDER, digest, request.json(), uuid.uuid4())
+        for _ in range(200):
+            if len(sent) >= expected_replies:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        processor.cancel()
+        analyzer_agent._batch_task.cancel()
+        await asyncio.gather(processor, analyzer_agent._batch_task, return_exceptions=True)
+
+
+def test_concurrent_requests_share_one_batched_call(fake_qwen, sent):
+    requests = [
+        _request("BTC-PERP", "ETH-PERP"),
+        _request("SOL-PERP", "BTC-PERP"),
+        _request("ETH-PERP", "SOL-PERP", z_score=-2.5),
+    ]
+    asyncio.run(_dispatch(requests, len(requests), sent))
+    
+    assert len(sent) == len(requests)
+    assert fake_qwen.single_calls == 0
+    assert fake_qwen.batch_sizes == [3]
+    assert {reply.signal for _, reply in sent} == {"SHORT", "LONG"}
+
+
+def test_identical_concurrent_requests_share_one_analysis(fake_qwen, sent):
+    requests = [_request("BTC-PERP", "ETH-PERP") for _ in range(3)]
+    asyncio.run(_dispatch(requests, len(requests), sent))
+    
+    assert len(sent) == len(requests)
+    assert fake_qwen.single_calls == 1
+    assert fake_qwen.batch_sizes == []
+
+
+def test_same_pair_with_different_metrics_is_not_shared(fake_qwen, sent):
+    requests = [_request("BTC-PERP", "ETH-PERP", z_score=2.5), _request("BTC-PERP", "ETH-PERP", z_score=-2.5)]
+    asyncio.run(_dispatch(requests, len(requests), sent))
+    
+    assert fake_qwen.batch_sizes == [2]
+    assert sorted(reply.signal for _, reply in sent) == ["LONG", "SHORT"]
+
+
+def test_streamed_analysis_sends_partial_before_final(fake_qwen, sent, monkeypatch):
+    monkeypatch.setattr(analyzer_agent, "STREAM_PARTIAL", True)
+    asyncio.run(_dispatch([_request("BTC-PERP", "ETH-PERP")], 2, sent))
+    
+    assert [reply.partial for _, reply in sent] == [True, False]
+    assert [reply.signal for _, reply in sent] == ["SHORT", "SHORT"]
+    assert sent[1][1].reasoning == "r"
+    assert fake_qwen.batch_sizes == []
@@ -0,0 +1,136 @@
+import threading
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+from cachetools import TTLCache
+
+import cache_manager
+from cache_manager import _metrics_match
+
+BASE = {
+    "zScore": 2.0,
+    "corr": 0.85,
+    "mean": 0.0012,
+    "std": 0.0045,
+    "beta": 1.15,
+    "volatility": 0.023,
+}
+
+
+def test_identical_metrics_hit():
+    assert _metrics_match(dict(BASE), BASE)
+
+
+def test_small_drift_hits():
+    drifted = {**BASE, "zScore": 2.05, "corr": 0.86, "std": 0.0047, "volatility": 0.024}
+    assert _metrics_match(drifted, BASE)
+
+
+@pytest.mark.parametrize("change", [
+    {"zScore": 1.2},                 # back inside the mild-divergence band
+    {"zScore": 1.95},                # within tolerance but below the |Z| = 2 entry threshold
+    {"zScore": -2.0},                # opposite direction
+    {"corr": 0.45},                  # no longer suitable for pairs trading
+    {"corr": 0.69},                  # crosses the 0.7 "good" threshold
+    {"volatility": 0.23},            # volatility x10
+    {"beta": -1.15},                 # legs now move in opposite directions
+    {key: value * 2 for key, value in BASE.items()},  # every metric doubled
+])
+def test_signal_changing_deltas_miss(change):
+    assert not _metrics_match({**BASE, **change}, BASE)
+
+
+def test_missing_field_misses():
+    assert not _metrics_match({**BASE, "volatility": None}, BASE)
+
+
+def test_reverse_orientation_is_a_separate_key():
+    manager = cache_manager.CacheManager.__new__(cache_manager.CacheManager)
+    assert manager._make_pair_key("btc-perp", "eth-perp") == "BTC-PERP:ETH-PERP"
+    assert manager._make_pair_key("ETH-PERP", "BTC-PERP") == "ETH-PERP:BTC-PERP"
+    assert manager._make_pair_key("ETH-PERP", "BTC-PERP", cache_manager.AGENT_KEY_PREFIX) == "agent:ETH-PERP:BTC-PERP"
+
+
+def test_failed_init_is_retried(monkeypatch):
+    attempts = []
+    
+    class FlakyCacheManager:
+        def __init__(self, database_url):
+            attempts.append(database_url)
+            if len(attempts) == 1:
+                raise OSError("could not translate host name")
+    
+    monkeypatch.setenv("DATABASE_URL", "postgresql://db.example/cache")
+    monkeypatch.setattr(cache_manager, "CacheManager", FlakyCacheManager)
+    cache_manager._build_cache_manager.cache_clear()
+    try:
+        assert cache_manager.get_cache_manager() is None
+        manager = cache_manager.get_cache_manager()
+        assert isinstance(manager, FlakyCacheManager)
+        assert cache_manager.get_cache_manager() is manager
+        assert len(attempts) == 2
+    finally:
+        cache_manager._build_cache_manager.cache_clear()
+
+
+class FakePool:
+    """Stands in for the psycopg pool: every query returns `row` and is counted."""
+    
+    def __init__(self, row=None):
+        self.row = row
+        self.queries = 0
+    
+    def connection(self):
+        return self
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        pass
+    
+    def execute(self, query, params, prepare=False):
+        self.queries += 1
+        return self
+    
+    def fetchone(self):
+        return self.row
+
+
+def _manager(row=None):
+    manager = cache_manager.CacheManager.__new__(cache_manager.CacheManager)
+    manager._mem = TTLCache(maxsize=8, ttl=60)
+    manager._mem_raw = TTLCache(maxsize=8, ttl=60)
+    manager._mem_lock = threading.RLock()
+    manager._pool = FakePool(row)
+    return manager
+
+
+def _row(expires_in):
+    now = datetime.utcnow()
+    return ("BTC-PERP", "ETH-PERP", dict(BASE), {"signal": "SHORT"}, now, now + expires_in)
+
+
+def test_raw_hit_is_memoized():
+    manager = _manager(_row(timedelta(hours=1)))
+    raw = manager.get_cached_analysis_raw("BTC-PERP", "ETH-PERP")
+    assert orjson.loads(raw)["analysis"] == {"signal": "SHORT"}
+    
+    assert manager.get_cached_analysis_raw("BTC-PERP", "ETH-PERP") is raw
+    assert manager._pool.queries == 1
+
+
+def test_expired_raw_memo_is_not_served():
+    manager = _manager(_row(timedelta(hours=1)))
+    manager.get_cached_analysis_raw("BTC-PERP", "ETH-PERP")
+    
+    # Both memos outlive the row's expiry; the database no longer has a live row
+    past = datetime.utcnow() - timedelta(seconds=1)
+    key = manager._make_pair_key("BTC-PERP", "ETH-PERP")
+    manager._mem_raw[key] = (past, manager._mem_raw[key][1])
+    manager._mem[key] = (past, manager._mem[key][1])
+    manager._pool.row = None
+    
+    assert manager.get_cached_analysis_raw("BTC-PERP", "ETH-PERP") is None
+    assert manager._pool.queries == 2
@@ -0,0 +1,150 @@
+import time
+from concurrent.futures import Future
+
+import orjson
+import pytest
+import requests
+
+import combined_server
+
+PAIR = ("BTC-PERP", "ETH-PERP")
+METRICS = {"zScore": 2.5, "corr": 0.85, "mean": 0.0012, "std": 0.0045, "beta": 1.15, "volatility": 0.023}
+ANALYSIS = {"signal": "SHORT", "confidence": 0.8, "reasoning": "r", "risk_level": "LOW"}
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch):
+    monkeypatch.setattr(combined_server, "cache_manager", None)
+    monkeypatch.setattr(combined_server, "_HOT_CACHE", {})
+
+
+def test_fresh_response_is_uncached_but_hot_cache_hits_are_flagged_cached():
+    fresh = orjson.loads(combined_server._store_result(*PAIR, METRICS, ANALYSIS))
+    assert fresh["cached"] is False
+    
+    hit = orjson.loads(combined_server._lookup_cached_raw(PAIR))
+    assert hit["cached"] is True
+    assert hit["analysis"]["signal"] == "SHORT"
+    assert "cached_at" in hit and "expires_at" in hit
+
+
+def test_fallback_analyses_are_not_hot_cached():
+    combined_server._store_result(*PAIR, METRICS, {**ANALYSIS, "fallback": True})
+    assert combined_server._lookup_cached_raw(PAIR) is None
+
+
+def test_metrics_failure_serves_stale_payload(monkeypatch):
+    def fail(*args, **kwargs):
+        raise requests.ConnectionError("pair agent down")
+    
+    monkeypatch.setattr(combined_server._SESSION, "post", fail)
+    assert combined_server._calculate_metrics_sync(*PAIR, 200) is None
+    
+    combined_server._store_result(*PAIR, METRICS, ANALYSIS)
+    body, status = combined_server._analyze_uncached(*PAIR, 200)
+    assert status == 200
+    assert body["cached"] == "stale"
+    assert body["analysis"]["signal"] == "SHORT"
+
+
+def test_metrics_failure_without_stale_payload_is_an_error(monkeypatch):
+    monkeypatch.setattr(combined_server, "_calculate_metrics_sync", lambda *args: None)
+    body, status = combined_server._analyze_uncached(*PAIR, 200)
+    assert status == 500
+    assert "error" in body
+
+
+def test_waiter_timeout_is_a_504(monkeypatch):
+    monkeypatch.setattr(combined_server, "INFLIGHT_TIMEOUT_SECONDS", 0.01)
+    monkeypatch.setitem(combined_server._INFLIGHT, PAIR, Future())
+    
+    response = combined_server.app.test_client().post(
+        "/api/analyze", json={"symbolA": "BTC", "symbolB": "ETH"},
+    )
+    assert response.status_code == 504
+    assert "in-flight" in response.get_json()["error"]
+
+
+def test_waiter_timeout_serves_stale_payload(monkeypatch):
+    monkeypatch.setattr(combined_server, "INFLIGHT_TIMEOUT_SECONDS", 0.01)
+    monkeypatch.setattr(combined_server, "HOT_CACHE_FRESH_SECONDS", 0)
+    monkeypatch.setitem(combined_server._INFLIGHT, PAIR, Future())
+    combined_server._store_result(*PAIR, METRICS, ANALYSIS)
+    
+    response = combined_server.app.test_client().post(
+        "/api/analyze", json={"symbolA": "BTC", "symbolB": "ETH"},
+    )
+    assert response.status_code == 200
+    assert response.get_json()["cached"] == "stale"
+
+
+def test_token_bucket_allows_a_burst_then_reports_the_wait():
+    bucket = combined_server.TokenBucket(rate=10, capacity=2)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    
+    wait = bucket.acquire()
+    assert 0 < wait <= 0.1
+    time.sleep(wait + 0.01)
+    assert bucket.acquire() == 0
+
+
+def test_circuit_opens_after_consecutive_failures_and_half_opens_after_cooldown():
+    breaker = combined_server.CircuitBreaker(threshold=3, window=60, cooldown=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.retry_after() == 0
+    
+    breaker.record_failure()
+    assert 0 < breaker.retry_after() <= 0.05
+    
+    time.sleep(0.06)
+    assert breaker.retry_after() == 0
+    # Half-open: a single failure reopens it
+    breaker.record_failure()
+    assert breaker.retry_after() > 0
+
+
+def test_success_and_stale_failures_reset_the_count():
+    breaker = combined_server.CircuitBreaker(threshold=2, window=0.05, cooldown=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.retry_after() == 0
+    
+    time.sleep(0.06)
+    breaker.record_failure()
+    assert breaker.retry_after() == 0
+
+
+def test_open_circuit_answers_503_with_retry_after(monkeypatch):
+    breaker = combined_server.CircuitBreaker(threshold=1, window=60, cooldown=30)
+    breaker.record_failure()
+    monkeypatch.setattr(combined_server, "_UPSTREAM_BREAKER", breaker)
+    monkeypatch.setattr(combined_server, "_analyze_uncached", lambda *args: pytest.fail("upstream called"))
+    
+    body, status, headers = combined_server._guarded_analysis(*PAIR, 200)
+    assert status == 503
+    assert headers == {"Retry-After": "30"}
+
+
+def test_open_circuit_prefers_stale_payload(monkeypatch):
+    breaker = combined_server.CircuitBreaker(threshold=1, window=60, cooldown=30)
+    breaker.record_failure()
+    monkeypatch.setattr(combined_server, "_UPSTREAM_BREAKER", breaker)
+    combined_server._store_result(*PAIR, METRICS, ANALYSIS)
+    
+    body, status, headers = combined_server._guarded_analysis(*PAIR, 200)
+    assert status == 200
+    assert body["cached"] == "stale"
+
+
+def test_empty_bucket_answers_429_with_retry_after(monkeypatch):
+    bucket = combined_server.TokenBucket(rate=0.5, capacity=1)
+    bucket.acquire()
+    monkeypatch.setattr(combined_server, "_UPSTREAM_BUCKET", bucket)
+    monkeypatch.setattr(combined_server, "_UPSTREAM_BREAKER", combined_server.CircuitBreaker(5, 60, 30))
+    monkeypatch.setattr(combined_server, "_analyze_uncached", lambda *args: pytest.fail("upstream called"))
+    
+    body, status, headers = combined_server._guarded_analysis(*PAIR, 200)
+    assert status == 429
+    assert headers == {"Retry-After": "2"}
@@ -0,0 +1,366 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import orjson
+import pytest
+import requests
+
+import qwen3_client
+from qwen3_client import SYSTEM_PROMPT, Qwen3Analyzer
+
+# Captured before any test patches time.sleep for the retry loop
+_real_sleep = time.sleep
+
+COMPLETION = {"choices": [{"message": {"content": '{"signal": "LONG", "confidence": 0.7}'}}]}
+
+
+@pytest.fixture
+def analyzer():
+    with Qwen3Analyzer(openrouter_api_key="test-key") as analyzer:
+        yield analyzer
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    
+    async def record(delay):
+        delays.append(delay)
+    
+    monkeypatch.setattr(qwen3_client.asyncio, "sleep", record)
+    return delays
+
+
+def _run_async_call(analyzer, responses):
+    """Call _call_openrouter_async against a transport that replays `responses` in order."""
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+    
+    async def call():
+        analyzer._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        analyzer._async_loop = asyncio.get_running_loop()
+        try:
+            content, _usage = await analyzer._call_openrouter_async("prompt")
+            return content
+        finally:
+            await analyzer.aclose()
+    
+    return asyncio.run(call()), calls
+
+
+def test_async_call_retries_429_honouring_retry_after(analyzer, sleeps):
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "2"}),
+        httpx.Response(503),
+        httpx.Response(200, content=orjson.dumps(COMPLETION)),
+    ]
+    content, calls = _run_async_call(analyzer, responses)
+    
+    assert "LONG" in content
+    assert len(calls) == 3
+    assert sleeps == [2.0, qwen3_client._RETRY_BACKOFF * 2]
+
+
+def test_async_call_clamps_long_retry_after(analyzer, sleeps):
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "3600"}),
+        httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2099 07:28:00 GMT"}),
+        httpx.Response(200, content=orjson.dumps(COMPLETION)),
+    ]
+    content, calls = _run_async_call(analyzer, responses)
+    
+    assert "LONG" in content
+    assert sleeps == [qwen3_client._RETRY_AFTER_MAX] * 2
+
+
+def test_async_call_retries_connection_errors(analyzer, sleeps):
+    responses = [httpx.ConnectError("refused"), httpx.Response(200, content=orjson.dumps(COMPLETION))]
+    content, calls = _run_async_call(analyzer, responses)
+    
+    assert "LONG" in content
+    assert len(calls) == 2
+
+
+def test_async_call_gives_up_after_retry_budget(analyzer, sleeps):
+    with pytest.raises(RuntimeError):
+        _run_async_call(analyzer, [httpx.Response(500)])
+    assert len(sleeps) == qwen3_client._RETRY_TOTAL
+
+
+def test_client_errors_are_not_retried(analyzer, sleeps):
+    with pytest.raises(RuntimeError):
+        _run_async_call(analyzer, [httpx.Response(401)])
+    assert sleeps == []
+
+
+def test_parse_normalizes_schema_drift(analyzer):
+    raw = (
+        '```json\n{"signal": "short", "confidence": "1.3", "reasoning": null, "risk_level": "extreme", '
+        '"key_factors": "high z-score, strong correlation", "entry_recommendation": null}\n```'
+    )
+    parsed = analyzer._try_parse_analysis(raw)
+    assert parsed == {
+        "signal": "SHORT",
+        "confidence": 1.0,
+        "reasoning": "",
+        "risk_level": "MEDIUM",
+        "key_factors": ["high z-score", "strong correlation"],
+        "entry_recommendation": "",
+    }
+
+
+def test_parse_fills_missing_fields(analyzer):
+    parsed = analyzer._try_parse_analysis('{"signal": "LONG"}')
+    assert parsed["signal"] == "LONG"
+    assert parsed["confidence"] == 0.5
+    assert parsed["key_factors"] == []
+
+
+def test_unparseable_response_is_flagged_fallback(analyzer):
+    assert analyzer._try_parse_analysis("no json here") is None
+    assert analyzer._fallback_analysis("no json here")["fallback"] is True
+
+
+def test_concurrent_calls_each_get_their_own_usage(analyzer, monkeypatch):
+    monkeypatch.setattr(qwen3_client, "_RESULT_CACHE", qwen3_client.TTLCache(maxsize=8, ttl=60))
+    
+    async def handler(request):
+        # The slower first call finishes last, as a shared "last usage" would expose
+        tokens = 100 if b"AAA" in request.content else 200
+        await asyncio.sleep(0.05 if tokens == 100 else 0)
+        body = dict(COMPLETION, usage={"prompt_tokens": tokens})
+        return httpx.Response(200, content=orjson.dumps(body))
+    
+    def metrics(symbol):
+        return {"symbolA": symbol, "symbolB": "ETH", "zScore": 2.1, "corr": 0.8,
+                "mean": 0.0, "std": 1.0, "beta": 1.1, "volatility": 0.2}
+    
+    async def run():
+        analyzer._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        analyzer._async_loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.gather(
+                analyzer.analyze_pair_async(metrics("AAA")),
+                analyzer.analyze_pair_async(metrics("BBB")),
+            )
+        finally:
+            await analyzer.aclose()
+    
+    first, second = asyncio.run(run())
+    assert first["usage"] == {"prompt_tokens": 100}
+    assert second["usage"] == {"prompt_tokens": 200}
+    assert not any("usage" in cached for cached in qwen3_client._RESULT_CACHE.values())
+
+
+def test_system_prompt_is_long_enough_to_cache():
+    # Every word is at least one token, so this keeps the prefix above 1024 tokens
+    assert len(SYSTEM_PROMPT.split()) >= 1000
+
+
+def test_response_shape_is_set_by_the_user_prompt(analyzer):
+    metrics = {"symbolA": "BTC", "symbolB": "ETH", "zScore": 2.1, "corr": 0.8,
+               "mean": 0.0, "std": 1.0, "beta": 1.1, "volatility": 0.2}
+    assert "Respond with" not in SYSTEM_PROMPT
+    assert "single analysis object" in analyzer._build_analysis_prompt(metrics)
+    assert "JSON array of exactly 2" in analyzer._build_batch_prompt([metrics, metrics])
+
+
+class FakeStreamResponse:
+    """Just enough of requests.Response for _stream_openrouter."""
+    
+    def __init__(self, status_code=200, headers=None, lines=(), line_delay=0.0):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.lines = lines
+        self.line_delay = line_delay
+        self.closed = False
+    
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+    
+    def iter_lines(self):
+        for line in self.lines:
+            yield line
+            _real_sleep(self.line_delay)
+    
+    def close(self):
+        self.closed = True
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _sse(content):
+    return b"data: " + orjson.dumps({"choices": [{"delta": {"content": content}}]})
+
+
+@pytest.fixture
+def sync_posts(analyzer, monkeypatch):
+    """Replay FakeStreamResponses from the sync session, recording each call's timeout."""
+    posts = {"responses": [], "timeouts": [], "sleeps": []}
+    
+    def post(url, data=None, timeout=None, stream=False):
+        posts["timeouts"].append(timeout)
+        return posts["responses"][min(len(posts["timeouts"]), len(posts["responses"])) - 1]
+    
+    monkeypatch.setattr(analyzer._session, "post", post)
+    monkeypatch.setattr(qwen3_client.time, "sleep", posts["sleeps"].append)
+    return posts
+
+
+def test_sync_call_retries_within_the_deadline(analyzer, sync_posts):
+    sync_posts["responses"] = [
+        FakeStreamResponse(429, {"Retry-After": "3600"}),
+        FakeStreamResponse(lines=[_sse('{"signal": "LONG"}'), b"data: [DONE]"]),
+    ]
+    content, _ = analyzer._call_openrouter("prompt", deadline=time.monotonic() + 30)
+    
+    assert "LONG" in content
+    assert sync_posts["sleeps"] == [qwen3_client._RETRY_AFTER_MAX]
+    # Per-attempt timeouts never reach past the deadline
+    assert all(read <= 30 for _, read in sync_posts["timeouts"])
+
+
+def test_sync_call_gives_up_when_retry_would_pass_deadline(analyzer, sync_posts):
+    sync_posts["responses"] = [FakeStreamResponse(503, {"Retry-After": "5"})]
+    with pytest.raises(RuntimeError):
+        analyzer._call_openrouter("prompt", deadline=time.monotonic() + 1)
+    
+    assert len(sync_posts["timeouts"]) == 1
+    assert sync_posts["sleeps"] == []
+
+
+def test_sync_stream_is_closed_once_deadline_passes(analyzer, sync_posts):
+    response = FakeStreamResponse(lines=[_sse("{"), _sse('"signal"'), _sse(": ")], line_delay=0.05)
+    sync_posts["responses"] = [response]
+    with pytest.raises(RuntimeError, match="deadline"):
+        analyzer._call_openrouter("prompt", deadline=time.monotonic() + 0.02)
+    assert response.closed
+
+
+def test_result_key_tolerates_non_numeric_pass_through_fields(analyzer):
+    metrics = {"symbolA": "BTC", "symbolB": "ETH", "zScore": 2.1234, "corr": 0.8,
+               "halfLife": "N/A", "sharpe": float("inf"), "isCointegrated": True}
+    key = analyzer._result_key(metrics, 0.3)
+    assert 2.123 in key and "N/A" in key and "inf" in key
+    # Rounding still merges near-identical metrics
+    assert analyzer._result_key({**metrics, "zScore": 2.12341}, 0.3) == key
+
+
+def test_async_client_of_another_loop_is_closed_when_replaced(analyzer):
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+    thread.start()
+    
+    async def get_client():
+        return analyzer._get_async_client()
+    
+    try:
+        old_client = asyncio.run_coroutine_threadsafe(get_client(), other_loop).result(timeout=5)
+        new_client = asyncio.run(get_client())
+        # The close was scheduled on the old loop; let it run
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), other_loop).result(timeout=5)
+        assert new_client is not old_client
+        assert old_client.is_closed
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join(timeout=5)
+        other_loop.close()
+
+
+def test_stream_stops_reading_at_closing_fence(analyzer, sync_posts):
+    consumed = []
+    lines = [_sse("```json\n{"), _sse('"signal": "LONG"}'), _sse("\n```"), _sse(" Some trailing commentary")]
+    
+    class Recording(FakeStreamResponse):
+        def iter_lines(self):
+            for line in self.lines:
+                consumed.append(line)
+                yield line
+    
+    response = Recording(lines=lines)
+    sync_posts["responses"] = [response]
+    content, usage = analyzer._call_openrouter("prompt")
+    
+    assert content == '```json\n{"signal": "LONG"}\n```'
+    assert consumed == lines[:3]
+    assert response.closed
+    assert usage is None
+
+
+def test_stream_collects_usage_from_final_chunk(analyzer, sync_posts):
+    usage_chunk = b"data: " + orjson.dumps({"choices": [], "usage": {"prompt_tokens": 42}})
+    sync_posts["responses"] = [FakeStreamResponse(lines=[
+        b": OPENROUTER PROCESSING", _sse('{"signal": "LONG"}'), usage_chunk, b"data: [DONE]",
+    ])]
+    content, usage = analyzer._call_openrouter("prompt")
+    
+    assert content == '{"signal": "LONG"}'
+    assert usage == {"prompt_tokens": 42}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('"confidence": 0.7', None),           # the number may still be growing
+    ('"confidence": 0.75,', 0.75),
+    ('"confidence":0.8}', 0.8),
+    ('"confidence": 1\n', 1.0),
+])
+def test_partial_confidence_needs_a_complete_number(text, expected):
+    match = qwen3_client._STREAM_CONFIDENCE.search(text)
+    assert (float(match.group(1)) if match else None) == expected
+
+
+def test_analyze_pair_stream_yields_partial_then_final(analyzer, sync_posts, monkeypatch):
+    monkeypatch.setattr(qwen3_client, "_RESULT_CACHE", qwen3_client.TTLCache(maxsize=8, ttl=60))
+    sync_posts["responses"] = [FakeStreamResponse(lines=[
+        _sse('{"signal": "SHORT", '), _sse('"confidence": 0.7'), _sse('5, "reasoning": "wide spread"}'),
+    ])]
+    metrics = {"symbolA": "BTC", "symbolB": "ETH", "zScore": 2.1, "corr": 0.8,
+               "mean": 0.0, "std": 1.0, "beta": 1.1, "volatility": 0.2}
+    partial, final = analyzer.analyze_pair_stream(metrics)
+    
+    assert partial == {"signal": "SHORT", "confidence": 0.75, "partial": True}
+    assert final["signal"] == "SHORT" and final["reasoning"] == "wide spread"
+    assert "partial" not in final
+
+
+@pytest.mark.parametrize("raw", [
+    '[{"signal": "LONG"}]',                                  # one analysis missing
+    '[{"signal": "LONG"}, null]',                            # null element
+    '[{"signal": "LONG"}, {"confidence": "very high"}]',     # invalid field value
+    '{"signal": "LONG"}',                                    # object instead of array
+])
+def test_batch_parse_rejects_incomplete_or_invalid_arrays(analyzer, raw):
+    assert analyzer._parse_batch(raw, 2) is None
+
+
+def test_batch_parse_extracts_array_from_surrounding_text(analyzer):
+    raw = 'Here you go:\n[{"signal": "long"}, {"signal": "SHORT", "confidence": "0.6"}]\nDone.'
+    analyses = analyzer._parse_batch(raw, 2)
+    assert [a["signal"] for a in analyses] == ["LONG", "SHORT"]
+    assert analyses[1]["confidence"] == 0.6
+
+
+def test_unusable_batch_falls_back_to_one_call_per_pair(analyzer, monkeypatch):
+    monkeypatch.setattr(analyzer, "_call_openrouter", lambda *args, **kwargs: ('[{"signal": "LONG"}]', None))
+    singles = []
+    monkeypatch.setattr(
+        analyzer, "analyze_pair",
+        lambda metrics, temperature=0.3, deadline=None: singles.append(metrics) or {"signal": "NEUTRAL"},
+    )
+    metrics_list = [{"symbolA": "BTC", "symbolB": "ETH"}, {"symbolA": "SOL", "symbolB": "BTC"}]
+    
+    assert analyzer.analyze_pairs_batch(metrics_list) == [{"signal": "NEUTRAL"}] * 2
+    assert singles == metrics_list